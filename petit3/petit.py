@@ -9,10 +9,16 @@ such as line hashing, hash counting, and word usage counting. These
 options can be used to determine WHAT is normal and WHAT to look for.
 
 """
+
+import copy
+import datetime
+import glob
 import logging
+import os
+import re
 import signal
 import sys
-
+import time
 
 __author__ = "Scott McCarty"
 __copyright__ = "Copyright 2009, Scott McCarty"
@@ -26,6 +32,9 @@ import argparse
 
 from .processing import log_hash
 from .processing.log_crunch import CrunchLog
+from .processing.log_filter import Filter
+from .processing.log_fingerprint import LEARNED, learn
+from .processing.log_follow import LogFollower
 from .processing.log_graph import (
     DaysGraph,
     HoursGraph,
@@ -35,9 +44,25 @@ from .processing.log_graph import (
     YearsGraph,
 )
 from .processing.log_hash import DaemonHash, HostHash, SuperHash, WordHash
+from .processing.log_match import LineMatcher, compile_search
+from .processing.log_receiver import SyslogReceiver, parse_address
+from .processing.log_state import LogState
+from .processing.log_window import TimeWindow
 
 logger = logging.getLogger()
 
+# Reports which can be combined with --report
+GRAPHS = {
+    "sgraph": SecondsGraph,
+    "mgraph": MinutesGraph,
+    "hgraph": HoursGraph,
+    "dgraph": DaysGraph,
+    "mograph": MonthsGraph,
+    "ygraph": YearsGraph,
+}
+REPORTS = ("hash", "wordcount", "daemon", "host") + tuple(GRAPHS)
+
+
 # Process Signal
 def sigint_handler(signal, frame):
     sys.exit(0)
@@ -50,6 +75,120 @@ signal.signal(signal.SIGINT, sigint_handler)
 signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
 
+def report_list(string):
+    """Splits a comma separated list of report names"""
+
+    reports = string.split(",")
+    unknown = [report for report in reports if report not in REPORTS]
+
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown report {', '.join(unknown)}, choose from {', '.join(REPORTS)}"
+        )
+
+    return reports
+
+
+def log_paths(string):
+    """Expands a log path, which may be a glob, to the matching files"""
+
+    if string == "-":
+        return ["<stdin>"]
+
+    # Names of existing files are taken as they are, they may hold [ or *
+    if os.path.exists(string):
+        return [string]
+
+    paths = sorted(glob.glob(string))
+
+    if not paths:
+        raise argparse.ArgumentTypeError(f"can't open '{string}': no such file")
+
+    return paths
+
+
+def positive_int(string):
+    """Checks that a number of --jobs is a whole number above 0"""
+
+    try:
+        value = int(string)
+    except ValueError:
+        value = None
+
+    if value is None or value < 1:
+        raise argparse.ArgumentTypeError(f"invalid number '{string}', e.g. 4")
+
+    return value
+
+
+def listen_address(string):
+    """Splits a syslog address like udp://127.0.0.1:514"""
+
+    try:
+        return parse_address(string)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def similarity(string):
+    """Checks that a similarity is a number above 0 and at most 1"""
+
+    try:
+        value = float(string)
+    except ValueError:
+        value = None
+
+    if value is None or not 0 < value <= 1:
+        raise argparse.ArgumentTypeError(f"invalid similarity '{string}', e.g. 0.6")
+
+    return value
+
+
+def line_pattern(string):
+    """Checks that a --match or --exclude pattern compiles"""
+
+    try:
+        re.compile(string)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f"invalid pattern '{string}': {e}")
+
+    return string
+
+
+def timestamp(string):
+    """Parses a time like 2024-02-29T11:53, 2024-02-29 11:53:08, Feb 28
+    11:53 in the current year or 11:53 today"""
+
+    try:
+        date = datetime.datetime.fromisoformat(string)
+    except ValueError:
+        pass
+    else:
+        # Log timestamps are in local time
+        if date.tzinfo is not None:
+            date = date.astimezone().replace(tzinfo=None)
+        return date
+
+    now = datetime.datetime.now()
+
+    for fmt in ("%H:%M", "%H:%M:%S"):
+        try:
+            time_of_day = datetime.datetime.strptime(string, fmt).time()
+        except ValueError:
+            continue
+        return datetime.datetime.combine(now.date(), time_of_day)
+
+    for fmt in ("%b %d %H:%M", "%b %d %H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(f"{now.year} {string}", f"%Y {fmt}")
+        except ValueError:
+            continue
+
+    raise argparse.ArgumentTypeError(
+        f"invalid time '{string}', e.g. 2024-02-29T11:53, 'Feb 28 11:53' or 11:53"
+    )
+
+
 def handle_cli():
     """Adds all options in one concise function"""
     parser = argparse.ArgumentParser()
@@ -125,6 +264,83 @@ def handle_cli():
         help="Use fingerprinting to remove certain patterns, e.g., reboots.",
     )
 
+    parser.add_argument(
+        "--learn",
+        dest="learn",
+        metavar="FILE",
+        help="Learn a fingerprint from the logs, each a capture of the same "
+        f"event, e.g. a reboot, and write it to FILE{LEARNED}, to be copied to "
+        "/var/lib/petit/fingerprints",
+    )
+
+    parser.add_argument(
+        "--similarity",
+        dest="similarity",
+        type=similarity,
+        metavar="JACCARD",
+        help="With --fingerprint, also match lines whose words are this "
+        "similar to those of a fingerprint, e.g. 0.6",
+    )
+
+    parser.add_argument(
+        "--format",
+        dest="log_format",
+        choices=sorted(CrunchLog.formats()),
+        help="Log format, skips the detection of the format",
+    )
+
+    parser.add_argument(
+        "--mmap",
+        dest="mmap",
+        action="store_true",
+        default=False,
+        help="Memory map plain log files, samples are read back when shown",
+    )
+
+    parser.add_argument(
+        "--cache",
+        dest="cache",
+        action="store_true",
+        default=False,
+        help="Cache the parsed log in ~/.cache/petit3 for --daemon, --host and graphs",
+    )
+
+    parser.add_argument(
+        "--state",
+        dest="state",
+        metavar="FILE",
+        help="Keep the hash and offset of the log in FILE, --hash then "
+        "only reads lines appended since the last run",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=positive_int,
+        default=1,
+        help="Number of processes used by --hash, --daemon and --host",
+    )
+
+    parser.add_argument(
+        "--scrub-tokens",
+        dest="scrub_tokens",
+        action="store_true",
+        default=False,
+        help="Scrub the words of each line one by one, caching the scrubbed "
+        "words, -v shows the hit rate of the cache",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        dest="pipeline",
+        action="store_true",
+        default=False,
+        help="Read and parse the log in threads ahead of the report, helps "
+        "most with standard input and compressed logs, -v shows the "
+        "throughput of each stage",
+    )
+
     # Handle modes
     parser.add_argument(
         "-V",
@@ -167,6 +383,14 @@ def handle_cli():
         help="show a report of entries from each host",
     )
 
+    parser.add_argument(
+        "--scrubcheck",
+        dest="mode",
+        action="store_const",
+        const="mode_scrubcheck",
+        help="check the compiled scrubber against the sequential one",
+    )
+
     parser.add_argument(
         "--sgraph",
         dest="mode",
@@ -215,14 +439,97 @@ def handle_cli():
         help="show graph of first 10 years",
     )
 
+    parser.add_argument(
+        "--report",
+        dest="report",
+        type=report_list,
+        metavar="REPORTS",
+        help="show several reports from one pass over the log, "
+        "e.g., hash,daemon,host,hgraph",
+    )
+
     parser.add_argument("--end", choices=["now", "last"], default="now")
 
+    parser.add_argument(
+        "--match",
+        dest="match",
+        type=line_pattern,
+        action="append",
+        metavar="PATTERN",
+        help="Only use the lines which match PATTERN, a plain string or a "
+        "regular expression, can be given several times to match any of them",
+    )
+
+    parser.add_argument(
+        "--exclude",
+        dest="exclude",
+        type=line_pattern,
+        action="append",
+        metavar="PATTERN",
+        help="Skip the lines which match PATTERN, can be given several times",
+    )
+
+    parser.add_argument(
+        "--since",
+        dest="since",
+        type=timestamp,
+        metavar="TIME",
+        help="Only use the entries logged at or after TIME, e.g. "
+        "2024-02-29T11:53, 'Feb 28 11:53' or 11:53 today",
+    )
+
+    parser.add_argument(
+        "--until",
+        dest="until",
+        type=timestamp,
+        metavar="TIME",
+        help="Only use the entries logged at or before TIME",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--follow",
+        dest="follow",
+        action="store_true",
+        default=False,
+        help="Keep following the log and show the report again as lines are "
+        "appended, like tail -f",
+    )
+
+    parser.add_argument(
+        "--window",
+        dest="window",
+        type=positive_int,
+        metavar="MINUTES",
+        help="Only count the entries of the last MINUTES in --hash, --daemon "
+        "and --host, up to now or the last entry as given by --end",
+    )
+
+    parser.add_argument(
+        "--listen",
+        dest="listen",
+        type=listen_address,
+        action="append",
+        metavar="ADDRESS",
+        help="Receive syslog messages on udp://HOST:PORT, tcp://HOST:PORT or "
+        "unix://PATH instead of reading a log, can be given several times",
+    )
+
+    parser.add_argument(
+        "--interval",
+        dest="interval",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+        help="Seconds between the reports shown by --follow and --listen",
+    )
+
     parser.add_argument(
         "log",
-        nargs="?",
-        type=argparse.FileType("r"),
-        default=sys.stdin,
-        help="Log data to process",
+        nargs="*",
+        type=log_paths,
+        help="Log data to process, several files or globs, e.g. "
+        "'messages*', are read as one log",
     )
     return parser
 
@@ -248,6 +555,70 @@ def main():
     # Set up basic configuration
     logging.basicConfig(level=log_level)
 
+    # Filters are created by the modes, the hashes and the --jobs workers
+    Filter.by_token = args.scrub_tokens
+
+    # Flatten the expanded globs, standard input is read without files
+    args.log = [path for paths in args.log for path in paths] or ["<stdin>"]
+
+    # Combined reports take the place of a single mode
+    if args.report:
+        args.mode = "mode_report"
+
+    if args.learn:
+        args.mode = "mode_learn"
+
+    # Only the hash mode keeps a state
+    if args.state:
+        if args.mode != "mode_hash":
+            parser.error("--state only works with --hash")
+
+        for option in ("follow", "listen"):
+            if getattr(args, option):
+                parser.error(f"--state cannot be used with --{option}")
+
+    # Only the reports read from columns can be cached, the others stream
+    # their input
+    cached = ("daemon", "host") + tuple(GRAPHS)
+    if args.cache:
+        if args.mode not in [f"mode_{name}" for name in cached]:
+            parser.error(f"--cache only works with --{', --'.join(cached)}")
+
+        for option in ("follow", "listen"):
+            if getattr(args, option):
+                parser.error(f"--cache cannot be used with --{option}")
+
+    if args.window is not None and args.state:
+        parser.error("--window cannot be used with --state")
+
+    # The patterns of an option are searched as one regular expression,
+    # which must compile as well as each of them
+    for option in ("match", "exclude"):
+        try:
+            compile_search(getattr(args, option) or [])
+        except re.error as e:
+            parser.error(f"invalid --{option} patterns: {e}")
+
+    if args.similarity is not None and not args.fingerprint:
+        parser.error("--similarity needs --fingerprint")
+
+    if args.since or args.until:
+        for option in ("state", "follow", "listen"):
+            if getattr(args, option):
+                parser.error(f"--since and --until cannot be used with --{option}")
+
+    # Following and listening run the report of the mode, or the combined
+    # reports
+    live = "--listen" if args.listen else "--follow" if args.follow else None
+    if live and args.mode:
+        if args.mode != "mode_report":
+            args.report = [args.mode[len("mode_") :]]
+
+        if not set(args.report) <= set(REPORTS):
+            parser.error(f"{live} needs one of --{', --'.join(REPORTS)} or --report")
+
+        args.mode = "mode_listen" if args.listen else "mode_follow"
+
     if args.mode:
         dispatch(args)
     else:
@@ -261,6 +632,39 @@ def print_version():
     sys.exit(0)
 
 
+def make_window(args):
+    """Returns a new TimeWindow of --window minutes, or None"""
+
+    if args.window is None:
+        return None
+
+    return TimeWindow(args.window * 60)
+
+
+def slide_window(args, x):
+    """Expires the entries of a windowed hash before the window ending
+    now, a window ending at the last entry is where the entries left it"""
+
+    if args.end == "now":
+        x.slide(datetime.datetime.now())
+
+
+def open_log(args, **kwargs):
+    """Builds a CrunchLog from the log files and input options"""
+    return CrunchLog(
+        args.log,
+        log_format=args.log_format,
+        mapped=args.mmap,
+        cache=args.cache,
+        since=args.since,
+        until=args.until,
+        match=args.match,
+        exclude=args.exclude,
+        pipeline=args.pipeline,
+        **kwargs,
+    )
+
+
 def mode_version(args):
     print_version()
 
@@ -268,17 +672,23 @@ def mode_version(args):
 def mode_hash(args):
     """Runs in hashing mode"""
 
-    # Get entire log file into ram for speed
-    log = CrunchLog(args.log.name)
+    if args._filter == None or args._filter == True:
+        filter_filename = log_hash.STOPWORDS_HASH
+    else:
+        filter_filename = None
 
     # Build the Hash
-    if args._filter == None or args._filter == True:
-        x = SuperHash.manufacture(log, log_hash.STOPWORDS_HASH)
+    if args.state:
+        x = hash_state(args, filter_filename)
     else:
-        x = SuperHash.manufacture(log, None)
+        # Stream the log, entries are consumed while building the hash. A
+        # windowed hash needs several files in timestamp order
+        log = open_log(args, streaming=True, ordered=args.window is not None)
+        x = SuperHash.manufacture(log, filter_filename, args.jobs, make_window(args))
+        slide_window(args, x)
 
     if args.fingerprint:
-        x.fingerprint()
+        x.fingerprint(args.similarity)
 
     # Set sampling type
     x.sample = args.sample
@@ -290,10 +700,51 @@ def mode_hash(args):
     sys.exit(0)
 
 
+def hash_state(args, filter_filename):
+    """Builds the hash of a log from the hash saved in the state file and
+    the lines appended to the log since, then saves the new state"""
+
+    if len(args.log) != 1:
+        print("Only one log file can be hashed with --state")
+        sys.exit(1)
+
+    try:
+        state = LogState(
+            args.state,
+            args.log[0],
+            filter_filename,
+            args.log_format,
+            (args.match, args.exclude),
+        )
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    if state.start < state.end:
+        # The saved format is kept, the appended lines may be too few to
+        # detect it
+        if state.Entry is not None:
+            args.log_format = state.Entry.format
+
+        log = open_log(args, streaming=True, span=state.span)
+        x = state.update(SuperHash.manufacture(log, filter_filename, args.jobs))
+        Entry = log.Entry
+    else:
+        x, Entry = state.restore(), state.Entry
+
+    if x is None:
+        print("No data found")
+        sys.exit()
+
+    state.save(x, Entry)
+
+    return x
+
+
 def mode_wordcount(args):
     """Runs wordcount mode"""
     # Get input
-    log = CrunchLog(args.log.name)
+    log = open_log(args, streaming=True)
 
     # Create new word hash based on log file and filter created
     x = WordHash(log, log_hash.STOPWORDS_WORDS)
@@ -313,11 +764,15 @@ def mode_daemon(args):
     if args._filter == None:
         args._filter = True
 
-    # Get input
-    log = CrunchLog(args.log.name)
+    # Get input, only the columns used by the report are kept
+    if args.window is None:
+        log = open_log(args, columns=("daemon",))
+    else:
+        log = open_log(args, columns=("stamp", "daemon"), ordered=True)
 
     # Create new syslog hash based on log file and filter created
-    x = DaemonHash(log, log_hash.STOPWORDS_DAEMON)
+    x = DaemonHash.build(log, log_hash.STOPWORDS_DAEMON, args.jobs, make_window(args))
+    slide_window(args, x)
 
     # Print out the dictionary first sorted by the word with
     # the most entries with an alphabetical subsort
@@ -334,11 +789,15 @@ def mode_host(args):
     if args._filter == None:
         args._filter = True
 
-    # Get input
-    log = CrunchLog(args.log.name)
+    # Get input, only the columns used by the report are kept
+    if args.window is None:
+        log = open_log(args, columns=("host",))
+    else:
+        log = open_log(args, columns=("stamp", "host"), ordered=True)
 
     # Create new syslog hash based on log file and filter created
-    x = HostHash(log, log_hash.STOPWORDS_HOST)
+    x = HostHash.build(log, log_hash.STOPWORDS_HOST, args.jobs, make_window(args))
+    slide_window(args, x)
 
     # Print out the dictionary first sorted by the word with
     # the most entries with an alphabetical subsort
@@ -346,11 +805,47 @@ def mode_host(args):
     sys.exit(0)
 
 
+def mode_scrubcheck(args):
+    """Runs every line and word of the log through the compiled scrub
+    engine and the sequential scrubber of each filter and reports any
+    difference"""
+
+    filters = [
+        Filter(stopwords)
+        for stopwords in (
+            log_hash.STOPWORDS_HASH,
+            log_hash.STOPWORDS_HOST,
+            log_hash.STOPWORDS_DAEMON,
+            log_hash.STOPWORDS_WORDS,
+        )
+    ]
+
+    checked, mismatches = 0, 0
+    for line in CrunchLog.read_files(args.log):
+        words = line.split()
+
+        for string in [" ".join(words)] + words:
+            for f in filters:
+                expected = f.scrub_sequential(string)
+                actual = f.engine.scrub(string)
+                checked += 1
+
+                if actual != expected:
+                    mismatches += 1
+                    print(f"{os.path.basename(f._file)}: {string}")
+                    print(f"    expected: {expected}")
+                    print(f"    actual:   {actual}")
+
+    print(f"Checked: {checked} Mismatches: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
 def mode_seconds_graph(args):
     """Runs seconds graph mode"""
 
-    # Get input
-    log = CrunchLog(args.log.name)
+    # Get input, only the column used by the report is kept and several
+    # files are merged into one timeline
+    log = open_log(args, columns=("stamp",), ordered=True)
 
     # Create new syslog hash based on log file and filter created
     x = SecondsGraph(log, end=args.end)
@@ -368,8 +863,9 @@ def mode_seconds_graph(args):
 def mode_minutes_graph(args):
     """Runs minutes graph mode"""
 
-    # Get input
-    log = CrunchLog(args.log.name)
+    # Get input, only the column used by the report is kept and several
+    # files are merged into one timeline
+    log = open_log(args, columns=("stamp",), ordered=True)
 
     # Create new syslog hash based on log file and filter created
     x = MinutesGraph(log, end=args.end)
@@ -387,11 +883,12 @@ def mode_minutes_graph(args):
 def mode_hours_graph(args):
     """Runs hours graph mode"""
 
-    # Get input
-    log = CrunchLog(args.log.name)
+    # Get input, only the column used by the report is kept and several
+    # files are merged into one timeline
+    log = open_log(args, columns=("stamp",), ordered=True)
 
     # Create new syslog hash based on log file and filter created
-    x = HoursGraph(log)
+    x = HoursGraph(log, end=args.end)
 
     # Set tick & width options
     x.tick = args.tick
@@ -406,8 +903,9 @@ def mode_hours_graph(args):
 def mode_days_graph(args):
     """Runs days graph mode"""
 
-    # Get input
-    log = CrunchLog(args.log.name)
+    # Get input, only the column used by the report is kept and several
+    # files are merged into one timeline
+    log = open_log(args, columns=("stamp",), ordered=True)
 
     # Create new syslog hash based on log file and filter created
     x = DaysGraph(log, end=args.end)
@@ -425,8 +923,9 @@ def mode_days_graph(args):
 def mode_months_graph(args):
     """Runs months graph mode"""
 
-    # Get input
-    log = CrunchLog(args.log.name)
+    # Get input, only the column used by the report is kept and several
+    # files are merged into one timeline
+    log = open_log(args, columns=("stamp",), ordered=True)
 
     # Create new syslog hash based on log file and filter created
     x = MonthsGraph(log, end=args.end)
@@ -444,8 +943,9 @@ def mode_months_graph(args):
 def mode_years_graph(args):
     """Runs years graph mode"""
 
-    # Get input
-    log = CrunchLog(args.log.name)
+    # Get input, only the column used by the report is kept and several
+    # files are merged into one timeline
+    log = open_log(args, columns=("stamp",), ordered=True)
 
     # Create new syslog hash based on log file and filter created
     x = YearsGraph(log, end=args.end)
@@ -460,17 +960,225 @@ def mode_years_graph(args):
     sys.exit(0)
 
 
+def make_reports(args, LogHash):
+    """Returns the name and an empty report of each of --report, which
+    are filled with add. The hash report is a LogHash"""
+
+    reports = []
+    for name in args.report:
+        if name == "hash":
+            x = LogHash(
+                None,
+                log_hash.STOPWORDS_HASH if args._filter else None,
+                make_window(args),
+            )
+            x.sample = args.sample
+        elif name == "wordcount":
+            x = WordHash(None, log_hash.STOPWORDS_WORDS)
+        elif name == "daemon":
+            x = DaemonHash(None, log_hash.STOPWORDS_DAEMON, make_window(args))
+        elif name == "host":
+            x = HostHash(None, log_hash.STOPWORDS_HOST, make_window(args))
+        else:
+            x = GRAPHS[name](None, end=args.end)
+            x.tick = args.tick
+            x.wide = args.wide
+
+        reports.append((name, x))
+
+    return reports
+
+
+def feed_reports(reports, entries):
+    """Adds each entry to all reports"""
+
+    for entry in entries:
+        for name, x in reports:
+            x.add(entry)
+
+
+def show_reports(reports, headers=True):
+    """Shows the reports in the order given, each under a header. A report
+    which is None had no entries"""
+
+    for i, (name, x) in enumerate(reports):
+        if headers:
+            if i:
+                print()
+            print(f"== {name} ==")
+
+        if x is None:
+            print("No entries")
+        else:
+            x.display()
+
+
+def mode_report(args):
+    """Runs several reports, feeding each entry of one pass over the log
+    to all of them, and shows the reports in the order given"""
+
+    # Stream the log, it is read and parsed only once. Graphs and windows
+    # need the entries of several files in timestamp order
+    ordered = args.window is not None or any(name in GRAPHS for name in args.report)
+    log = open_log(args, streaming=True, ordered=ordered)
+
+    reports = make_reports(args, SuperHash.select(log))
+    feed_reports(reports, log)
+
+    shown = []
+    for name, x in reports:
+        if isinstance(x, SuperHash):
+            slide_window(args, x)
+            x.cleanup()
+        elif len(x.epochs):
+            x.build_graph()
+        else:
+            # A graph without entries would end the run, the other reports
+            # are still shown
+            x = None
+
+        if name == "hash" and args.fingerprint:
+            x.fingerprint(args.similarity)
+
+        shown.append((name, x))
+
+    show_reports(shown)
+
+    sys.exit(0)
+
+
+def mode_learn(args):
+    """Learns a fingerprint from several captures of an event, the keys
+    found in all of them"""
+
+    if "<stdin>" in args.log:
+        print("Fingerprints are learned from log files")
+        sys.exit(1)
+
+    hashes = [
+        SuperHash.manufacture(
+            CrunchLog(path, streaming=True, log_format=args.log_format),
+            log_hash.STOPWORDS_HASH,
+        )
+        for path in args.log
+    ]
+
+    path = args.learn
+    if not path.endswith(LEARNED):
+        path += LEARNED
+
+    fingerprint = learn(os.path.basename(path), hashes)
+    if fingerprint is None:
+        print("The captures have no lines in common")
+        sys.exit(1)
+
+    fingerprint.save(path, len(hashes))
+
+    print(
+        f"Learned {len(fingerprint.keys)} of {len(hashes[0])} keys "
+        f"from {len(hashes)} captures into {path}"
+    )
+    sys.exit(0)
+
+
+def mode_follow(args):
+    """Runs the reports on a log, then keeps following the log and shows
+    the reports again every interval seconds, counting only the lines
+    appended since. Graphs of now slide with the clock"""
+
+    if len(args.log) != 1:
+        print("Only one log file can be followed")
+        sys.exit(1)
+
+    try:
+        follower = LogFollower(args.log[0])
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    # The lines already in the log are read once, as a log
+    follower.wait(args.interval)
+    log = open_log(args, streaming=True, span=(0, follower.offset))
+
+    reports = make_reports(args, SuperHash.select(log))
+    feed_reports(reports, log)
+
+    while True:
+        show_live_reports(args, reports)
+
+        time.sleep(args.interval)
+        feed_reports(reports, follower.entries(log.Entry, log.matcher))
+
+
+def show_live_reports(args, reports, extra=()):
+    """Shows reports which keep being added to, followed by the extra
+    reports"""
+
+    shown = []
+    for name, x in reports:
+        if isinstance(x, SuperHash):
+            slide_window(args, x)
+            x.cleanup()
+
+            # Fingerprints replace keys, which must keep counting
+            if name == "hash" and args.fingerprint:
+                x = copy.copy(x)
+                x.data = dict(x.data)
+                x.fingerprint(args.similarity)
+        elif not x.refresh():
+            continue
+
+        shown.append((name, x))
+
+    shown += extra
+
+    # Draw over the previous reports on a terminal
+    if sys.stdout.isatty():
+        print("\033[H\033[J", end="")
+
+    show_reports(shown, headers=len(shown) > 1)
+    sys.stdout.flush()
+
+
+def mode_listen(args):
+    """Receives syslog messages and shows the reports of the messages
+    received so far every interval seconds, on SIGUSR1 and on exit"""
+
+    # Received messages are syslog or rsyslog lines, hashed alike
+    reports = make_reports(args, log_hash.SyslogHash)
+    receiver = SyslogReceiver(
+        lambda entry: feed_reports(reports, [entry]),
+        matcher=LineMatcher(args.match, args.exclude),
+    )
+
+    def dump():
+        show_live_reports(args, reports, [("receiver", receiver)])
+
+    try:
+        receiver.run(args.listen, args.interval, dump)
+    except OSError as e:
+        print(f"Cannot listen: {e}")
+        sys.exit(1)
+
+    sys.exit(0)
+
+
 modes = {
     "mode_hash": mode_hash,
     "mode_wordcount": mode_wordcount,
     "mode_host": mode_host,
     "mode_daemon": mode_daemon,
+    "mode_scrubcheck": mode_scrubcheck,
     "mode_sgraph": mode_seconds_graph,
     "mode_mgraph": mode_minutes_graph,
     "mode_hgraph": mode_hours_graph,
     "mode_dgraph": mode_days_graph,
     "mode_mograph": mode_months_graph,
     "mode_ygraph": mode_years_graph,
+    "mode_report": mode_report,
+    "mode_learn": mode_learn,
+    "mode_follow": mode_follow,
+    "mode_listen": mode_listen,
     "mode_version": mode_version,
 }
 
@@ -0,0 +1,206 @@
+"""Persistent cache of the columnar store of a log file. The detected
+entry type and the columns are pickled to ~/.cache/petit3, keyed by the
+device and inode of the file and the columns used. The cache is used as
+long as the size and modification time of the file are unchanged. When
+the file has only grown, just the appended lines are parsed.
+
+Loading a pickle can run code, so cache files are only loaded when they
+belong to the user running petit3 and nobody else can write to them.
+
+"""
+
+import json
+import locale
+import logging
+import os
+import pickle
+import stat
+import tempfile
+
+from .log_columns import LogColumns
+from .log_input import compression
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "petit3"
+)
+
+# Bumped whenever the layout of the cached columns changes
+VERSION = 1
+
+# Bytes at the end of the cached part of a file which must be unchanged
+# for the cache to be extended with appended lines
+CHECK_SIZE = 4096
+
+
+def check_bytes(path, offset):
+    """Returns the bytes of a file just before offset, which are compared
+    to tell whether the file has only been appended to since"""
+
+    with open(path, "rb") as f:
+        f.seek(max(0, offset - CHECK_SIZE))
+        return f.read(min(offset, CHECK_SIZE))
+
+
+def dump(state, path, text=False):
+    """Pickles state, or with text=True writes it as JSON, to a new file
+    which is then moved in place, so that readers never see a partly
+    written file"""
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    fd, name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        if text:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+        else:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(name, path)
+    except BaseException:
+        os.unlink(name)
+        raise
+
+
+def load(path):
+    """Unpickles a file written by dump. Raises PermissionError if the file
+    belongs to another user or others can write to it, as it could then
+    have been replaced by a pickle which runs code"""
+
+    with open(path, "rb") as f:
+        status = os.fstat(f.fileno())
+
+        if status.st_uid != os.geteuid():
+            raise PermissionError("the file belongs to another user")
+
+        if status.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise PermissionError("other users can write to the file")
+
+        return pickle.load(f)
+
+
+class LogCache:
+    """Cached columns of one log file"""
+
+    def __init__(self, path, columns, log_format=None, cache_dir=CACHE_DIR):
+        status = os.stat(path)
+
+        self.path = path
+        self.size = status.st_size
+        self.mtime = status.st_mtime_ns
+        self.file = os.path.join(
+            cache_dir, f"{status.st_dev}-{status.st_ino}-{'+'.join(columns)}.cache"
+        )
+
+        self.state = self.load()
+
+        # Entries of another format than the one asked for are not used
+        if self.state and log_format and self.Entry.format != log_format:
+            self.state = None
+
+    @property
+    def Entry(self):
+        return self.state["Entry"]
+
+    @property
+    def usable(self):
+        """Whether the cached columns are those of the file, or of the
+        file before lines were appended to it"""
+
+        if not self.state:
+            return False
+
+        if self.state["size"] == self.size:
+            return self.state["mtime"] == self.mtime
+
+        return (
+            self.state["complete"]
+            and self.state["size"] < self.size
+            and self.state["check"] == check_bytes(self.path, self.state["size"])
+        )
+
+    def load(self):
+        """Returns the cached state, or None"""
+
+        try:
+            state = load(self.file)
+        except FileNotFoundError:
+            return None
+        except PermissionError as e:
+            logger.warning(f"Ignoring cache {self.file}: {e}")
+            return None
+        except Exception as e:
+            logger.info(f"Ignoring cache {self.file}: {e}")
+            return None
+
+        if state.get("version") != VERSION:
+            return None
+
+        return state
+
+    def save(self, Entry, columns, size, complete):
+        """Writes the columns of the first size bytes of the file"""
+
+        state = {
+            "version": VERSION,
+            "Entry": Entry,
+            "columns": columns,
+            "size": size,
+            "mtime": self.mtime,
+            "complete": complete,
+            "check": check_bytes(self.path, size),
+        }
+
+        try:
+            dump(state, self.file)
+        except OSError as e:
+            logger.warning(f"Cannot write cache {self.file}: {e}")
+
+    def columns(self, log):
+        """Returns the columns of a log, from the cache completed with any
+        appended lines, or parsed and then cached"""
+
+        if self.usable:
+            columns = self.state["columns"]
+            start = self.state["size"]
+            logger.info(f"Loaded {len(columns)} rows from cache {self.file}")
+
+            if start == self.size:
+                return columns
+        else:
+            columns = LogColumns(log.Entry, log.column_names)
+            start = 0
+
+        # Compressed files can only be read as a whole
+        if compression(self.path) is not None:
+            lines, tail = log.read_lines(self.path), None
+        else:
+            tail = {"size": start, "complete": True}
+            lines = self.read(start, tail)
+
+        for entry in log.parse(lines, len(columns)):
+            columns.append(entry)
+
+        if tail is None:
+            self.save(log.Entry, columns, self.size, False)
+        else:
+            self.save(log.Entry, columns, tail["size"], tail["complete"])
+
+        return columns
+
+    def read(self, start, tail):
+        """Yields the decoded lines of the file after offset start. The
+        offset after the last line read is kept in tail, along with
+        whether that line was complete"""
+
+        encoding = locale.getpreferredencoding(False)
+
+        with open(self.path, "rb") as f:
+            f.seek(start)
+
+            for line in f:
+                tail["size"] += len(line)
+                tail["complete"] = line.endswith(b"\n")
+                yield line.decode(encoding)
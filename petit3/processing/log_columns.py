@@ -0,0 +1,287 @@
+"""Columnar store for parsed log entries. Timestamps are kept as epoch
+seconds, hosts and daemons are dictionary encoded and payloads share one
+buffer, so a log only costs a few bytes per line and column. Only the
+columns a report needs are built, and Row objects give the LogEntry
+interface on top of the columns where whole entries are expected.
+
+"""
+
+import calendar
+import datetime
+from array import array
+from collections import Counter
+
+COLUMNS = ("stamp", "host", "daemon", "log_entry")
+
+# Timestamps which are not a valid date, e.g. Feb 30, never match a graph key
+INVALID_EPOCH = -(2**63)
+INVALID_STAMP = (0, 0, 0, 0, 0, 0)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_epoch(stamp):
+    """Converts year, month, day, hour, minute and second to epoch seconds"""
+
+    try:
+        return calendar.timegm(datetime.datetime(*stamp).timetuple())
+    except (ValueError, OverflowError):
+        return INVALID_EPOCH
+
+
+def from_epoch(epoch):
+    """Converts epoch seconds back to year, month, day, hour, minute and
+    second"""
+
+    if epoch == INVALID_EPOCH:
+        return INVALID_STAMP
+
+    return (EPOCH + datetime.timedelta(seconds=epoch)).timetuple()[:6]
+
+
+class Dictionary:
+    """Dictionary encoded string column. Ids are handed out in order of
+    first appearance and the row of each first appearance is kept"""
+
+    def __init__(self):
+        self.ids = array("L")
+        self.values = []
+        self.first_rows = array("Q")
+        self.index = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, row):
+        return self.values[self.ids[row]]
+
+    def append(self, value):
+        i = self.index.get(value)
+
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+            self.first_rows.append(len(self.ids))
+
+        self.ids.append(i)
+
+    def summary(self, rows=None):
+        """Returns value, row count and first row of each distinct value,
+        in order of first appearance among the given rows"""
+
+        if rows is None:
+            counts = Counter(self.ids)
+            return [
+                (value, counts[i], self.first_rows[i])
+                for i, value in enumerate(self.values)
+            ]
+
+        seen = {}
+        for row in rows:
+            i = self.ids[row]
+            if i in seen:
+                seen[i][1] += 1
+            else:
+                seen[i] = [self.values[i], 1, row]
+
+        return [tuple(item) for item in seen.values()]
+
+
+class Payloads:
+    """String column stored as UTF-8 in one buffer addressed by offsets"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array("Q", [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.buffer[start:end].decode("utf-8", "surrogateescape")
+
+    def append(self, value):
+        self.buffer += value.encode("utf-8", "surrogateescape")
+        self.offsets.append(len(self.buffer))
+
+
+class MappedPayloads:
+    """Payload column of a mapped log, which only keeps the line offset
+    of each row and parses the payload from the mapping when it is read"""
+
+    def __init__(self, Entry):
+        self.Entry = Entry
+        self.files = []
+        self.file_ids = array("H")
+        self.offsets = array("Q")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, row):
+        mapped = self.files[self.file_ids[row]]
+        return self.Entry(mapped.line(self.offsets[row])).log_entry
+
+    def append(self, source):
+        mapped, offset = source
+
+        if mapped not in self.files:
+            self.files.append(mapped)
+
+        self.file_ids.append(self.files.index(mapped))
+        self.offsets.append(offset)
+
+
+class Row:
+    """Read only LogEntry view of one row of a LogColumns store"""
+
+    __slots__ = ("columns", "index", "_stamp")
+
+    def __init__(self, columns, index):
+        self.columns = columns
+        self.index = index
+        self._stamp = None
+
+    @property
+    def stamp(self):
+        if self._stamp is None:
+            self._stamp = from_epoch(self.columns.stamps[self.index])
+        return self._stamp
+
+    @property
+    def year(self):
+        return self.stamp[0]
+
+    @property
+    def month(self):
+        return self.stamp[1]
+
+    @property
+    def day(self):
+        return self.stamp[2]
+
+    @property
+    def hour(self):
+        return self.stamp[3]
+
+    @property
+    def minute(self):
+        return self.stamp[4]
+
+    @property
+    def second(self):
+        return self.stamp[5]
+
+    @property
+    def host(self):
+        return self.columns.hosts[self.index]
+
+    @property
+    def daemon(self):
+        return self.columns.daemons[self.index]
+
+    @property
+    def log_entry(self):
+        return self.columns.payloads[self.index]
+
+    def display(self):
+        print(
+            "Year: ",
+            self.year,
+            "Month:",
+            self.month,
+            "Day:",
+            self.day,
+            "Hour:",
+            self.hour,
+            "Minute:",
+            self.minute,
+            "Second:",
+            self.second,
+            "Host:",
+            self.host,
+            "Payload",
+            self.log_entry,
+        )
+
+
+class LogColumns:
+    """Columnar store of the entries of a log. A store can be a view on
+    selected rows of another store, in which case it shares its columns.
+    The payloads of a mapped log are kept as line offsets"""
+
+    def __init__(self, Entry, columns=COLUMNS, mapped=False):
+        unknown = set(columns) - set(COLUMNS)
+        assert not unknown, f"Unknown columns: {unknown}"
+
+        self.Entry = Entry
+        self.names = tuple(columns)
+        self.length = 0
+
+        # Underlying rows of a view, None for the store itself
+        self.rows = None
+
+        self.stamps = array("q") if "stamp" in columns else None
+        self.hosts = Dictionary() if "host" in columns else None
+        self.daemons = Dictionary() if "daemon" in columns else None
+        self.payloads = None
+        if "log_entry" in columns:
+            self.payloads = MappedPayloads(Entry) if mapped else Payloads()
+
+    def __len__(self):
+        if self.rows is not None:
+            return len(self.rows)
+        return self.length
+
+    def __iter__(self):
+        return (Row(self, index) for index in self.indices())
+
+    def indices(self):
+        """Returns the underlying row numbers of this store or view"""
+        if self.rows is not None:
+            return self.rows
+        return range(self.length)
+
+    def row(self, i):
+        return Row(self, self.indices()[i])
+
+    def append(self, entry):
+        """Adds the used columns of an entry"""
+
+        if self.stamps is not None:
+            self.stamps.append(to_epoch(entry.stamp))
+        if self.hosts is not None:
+            self.hosts.append(entry.host)
+        if self.daemons is not None:
+            self.daemons.append(entry.daemon)
+        if isinstance(self.payloads, MappedPayloads):
+            self.payloads.append(entry.source)
+        elif self.payloads is not None:
+            self.payloads.append(entry.log_entry)
+
+        self.length += 1
+
+    def epochs(self):
+        """Returns the epoch seconds of the rows of this store or view"""
+
+        if self.rows is None:
+            return self.stamps
+
+        return array("q", (self.stamps[row] for row in self.rows))
+
+    def dictionary(self, name):
+        """Returns a dictionary encoded column, or None if not built"""
+        return {"host": self.hosts, "daemon": self.daemons}.get(name)
+
+    def select(self, rows):
+        """Returns a view on the given rows, sharing the columns"""
+
+        view = LogColumns(self.Entry, ())
+        view.names = self.names
+        view.length = self.length
+        view.stamps, view.hosts = self.stamps, self.hosts
+        view.daemons, view.payloads = self.daemons, self.payloads
+        view.rows = array("Q", rows)
+
+        return view
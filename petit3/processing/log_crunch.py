@@ -5,13 +5,27 @@ SuperHash or GraphHash.
 
 """
 
+import copy
 import datetime
+import heapq
+import importlib
+import inspect
 import logging
-import random
 import re
 import sys
 from collections import UserList
 from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain, islice
+from operator import attrgetter
+
+from .log_cache import LogCache
+from .log_columns import LogColumns
+from .log_input import compression, map_file, open_compressed, spread_lines
+from .log_match import LineMatcher
+from .log_parallel import read_chunk
+from .log_pipeline import Pipeline
+from .log_range import TimeRange
 
 
 class Tally:
@@ -49,42 +63,319 @@ class Tally:
 class CrunchLog(UserList):
     """
     Class which extends UserList to provide robust in memory log object
+
+    When built with streaming=True, only a bounded prefix of the input is
+    buffered for format detection. Entries are then parsed one at a time
+    while the log is iterated, so a streaming log can only be consumed once.
+
+    When built with columns, e.g. ("stamp",), the entries are kept in a
+    columnar LogColumns store which only holds the named columns. The
+    store is built the first time the log is used.
+
+    A log can be built from several files, e.g. a set of rotated logs,
+    which share the format of the first file. The files are read one after
+    the other, or with ordered=True merged into one timeline by timestamp.
+
+    With mapped=True plain files are memory mapped. Entries then refer to
+    their line in the mapping, which lets samples and the payload column
+    keep offsets instead of text.
+
+    With cache=True the columns of a single plain or compressed file are
+    cached on disk, see LogCache. A cached log skips format detection and
+    only parses the lines appended since the cache was written.
+
+    With span=(start, end) only the lines between two byte offsets of a
+    single plain file are read, e.g. the lines appended since a checkpoint.
+
+    With since and/or until, datetimes, only the entries of that time range
+    are kept. Only the part of a plain file holding the time range is read,
+    which is found by binary search once the format is known.
+
+    With match and/or exclude, lists of patterns, only the lines which
+    match one of match and none of exclude are parsed, see LineMatcher.
+    The format is still detected on the first lines of the input.
+
+    With pipeline=True the lines are read and parsed by threads ahead of
+    the code using the entries, see Pipeline. This helps most with
+    standard input and compressed files. Mapped files are parsed in place.
     """
 
-    def __init__(self, f=""):
+    # Number of leading lines buffered for format detection when streaming
+    detection_prefix = 1000
+
+    # Format detection scores the first detection_lines lines of the buffer
+    # and detection_strata lines at evenly spaced offsets of the first file,
+    # or of the rest of the buffer if the file cannot be read at offsets
+    detection_lines = 100
+    detection_strata = 100
+
+    def __init__(
+        self,
+        f="",
+        streaming=False,
+        columns=None,
+        ordered=False,
+        log_format=None,
+        mapped=False,
+        cache=False,
+        span=None,
+        since=None,
+        until=None,
+        match=None,
+        exclude=None,
+        pipeline=False,
+    ):
         UserList.__init__(self)
 
-        buf = []
-
-        with CrunchLog.stream(f) as _in:
-            for line in _in:
-                buf.append(line)
+        self.streaming = streaming
+        self.columnar = columns is not None
+        self.column_names = columns
+        self.file_names = [f] if isinstance(f, str) else list(f)
+        self.file_name = ", ".join(self.file_names)
+        self.time_range = TimeRange(since, until)
+        self.matcher = LineMatcher(match, exclude)
+        self.pipeline = pipeline
+
+        assert span is None or len(self.file_names) == 1, "Span of several files"
+
+        # Byte ranges of the files which are not read as a whole
+        self.spans = {}
+        if span is not None:
+            self.spans[self.file_names[0]] = span
+
+        # A single file is always in order
+        self.ordered = ordered and len(self.file_names) > 1
+
+        # Only map the files if all of them can be mapped
+        mapped = mapped and span is None and not self.time_range
+        self.maps = [map_file(name) for name in self.file_names] if mapped else []
+        self.mapped = bool(self.maps) and all(self.maps)
+
+        if mapped and not self.mapped:
+            logging.info(f"Cannot map {self.file_name}, reading it instead")
+
+        self._columns = None
+
+        # Only the columns of one file can be cached
+        self.cache = None
+        selected = self.spans or self.time_range or self.matcher
+        if cache and self.columnar and not self.mapped and not selected:
+            if len(self.file_names) == 1 and self.file_names[0] != "<stdin>":
+                self.cache = LogCache(self.file_names[0], columns, log_format)
+            else:
+                logging.info(f"Cannot cache {self.file_name}, reading it instead")
+        elif cache and self.columnar:
+            logging.info(f"Cannot cache a part of {self.file_name}, reading it instead")
+
+        if self.cache is not None and self.cache.usable:
+            self.Entry = self.cache.Entry
+            self.payload_type = self.Entry.__name__
+            self.build_date = datetime.datetime.now()
+            self._lines = iter(())
+            self._prefix = []
+            return
+
+        self._lines = self.read_inputs()
+
+        if streaming or self.columnar or self.time_range:
+            buf = list(islice(self._lines, self.detection_prefix))
+        else:
+            buf = list(self._lines)
 
         if len(buf) < 1:
             print("No data found")
             sys.exit()
 
-        # Automatically select log format
-        self.Entry = self.select_log_format(buf)
+        # Automatically select log format, unless it is given
+        if log_format is None:
+            self.Entry = self.select_log_format(buf)
+        else:
+            self.Entry = self.formats()[log_format]
 
         # Save for introspective purpose
         self.payload_type = self.Entry.__name__
-        self.file_name = f
         self.build_date = datetime.datetime.now()
 
-        # Build from entry type
-        counter = 0
-        for line in buf:
+        # Find the time range in plain files, now that entries can be parsed
+        timed = self.time_range and self.splittable
+        if timed:
+            for name in self.file_names:
+                self.spans[name] = self.time_range.span(
+                    name, self.Entry, self.spans.get(name)
+                )
+
+        if self.ordered or self.mapped or self.cache is not None or timed:
+            # The files are read again from the start
+            self._lines.close()
+            self._lines = iter(())
+            buf = []
+
+        if timed and not self.ordered:
+            self._lines = self.read_inputs()
+
+        # Keep the prefix, the remaining lines are pulled lazily
+        self._prefix = buf
+
+        if not (streaming or self.columnar):
+            # Build from entry type
+            self.data = list(self.entries())
+            del buf
+
+    def __iter__(self):
+        if self.columnar:
+            return iter(self.columns)
+
+        if not self.streaming:
+            return UserList.__iter__(self)
+
+        return self.entries()
+
+    def __len__(self):
+        if self.columnar:
+            return len(self.columns)
+
+        return UserList.__len__(self)
+
+    def __getitem__(self, i):
+        if self.columnar:
+            return self.columns.row(i)
+
+        return UserList.__getitem__(self, i)
+
+    @property
+    def columns(self):
+        """Columnar store of the log, built on first use"""
+
+        if self._columns is None and self.cache is not None:
+            self._prefix = None
+            self._columns = self.cache.columns(self)
+
+        if self._columns is None:
+            self._columns = LogColumns(
+                self.Entry, self.column_names, mapped=self.mapped
+            )
+
+            for entry in self.entries():
+                self._columns.append(entry)
+
+        return self._columns
+
+    @property
+    def splittable(self):
+        """Whether the input is a plain file which can be read in byte
+        ranges, rather than standard input or a compressed file"""
+
+        return all(
+            name != "<stdin>" and compression(name) is None for name in self.file_names
+        )
+
+    def dictionary(self, name):
+        """Returns the dictionary encoded host or daemon column of a
+        columnar log, or None"""
+
+        if self.columnar and name in self.column_names:
+            return self.columns.dictionary(name)
+
+        return None
+
+    def entries(self):
+        """Parses the input, which can only be done once"""
+
+        if self._prefix is None:
+            raise RuntimeError("Streaming CrunchLog can only be consumed once")
+
+        lines = chain(self._prefix, self._lines)
+        self._prefix = None
+
+        if self.mapped:
+            files = [self.parse_mapped(mapped) for mapped in self.maps]
+        elif self.ordered:
+            files = [
+                self.parse_input(self.read_input(name)) for name in self.file_names
+            ]
+        else:
+            files = [self.parse_input(lines)]
+
+        # The entries of each file are expected to be in order already
+        if self.ordered:
+            entries = heapq.merge(*files, key=attrgetter("stamp"))
+        else:
+            entries = chain.from_iterable(files)
+
+        if self.time_range:
+            return (entry for entry in entries if entry in self.time_range)
+
+        return entries
+
+    def parse_input(self, lines):
+        """Returns the entries of the lines of an input, parsed by a
+        pipeline when asked for"""
+
+        if self.pipeline:
+            return Pipeline(lines, self.parse)
+
+        return self.parse(lines)
+
+    def parse(self, lines, counter=0):
+        """Yields one entry of the detected type for each selected line,
+        counting lines from counter. Lines are counted before they are
+        selected, so that errors give the line of the input"""
+
+        for counter, line in self.matcher.select_pairs(enumerate(lines, counter)):
+            try:
+                yield self.Entry(line)
+            except (ValueError, TypeError):
+                print("Cannot parse values on line: " + str(counter))
+                sys.exit()
+
+    def parse_mapped(self, mapped):
+        """Yields one entry for each line of a mapped file, which refers
+        to its line in the mapping"""
+
+        lines = (
+            (counter, offset, line)
+            for counter, (offset, line) in enumerate(mapped.lines())
+        )
+
+        for counter, offset, line in self.matcher.select_pairs(lines):
             try:
-                self.append(self.Entry(line))
-                counter += 1
+                entry = self.Entry(line)
             except (ValueError, TypeError):
                 print("Cannot parse values on line: " + str(counter))
                 sys.exit()
 
-        del buf
+            entry.source = (mapped, offset)
+            yield entry
 
     @staticmethod
+    def read_lines(s):
+        """Generator which yields lines and closes the input when exhausted"""
+        with CrunchLog.stream(s) as _in:
+            for line in _in:
+                yield line
+
+    def read_input(self, name):
+        """Returns the lines of one input, only those of its span if it
+        has one"""
+
+        if name in self.spans:
+            return read_chunk(name, *self.spans[name])
+
+        return self.read_lines(name)
+
+    def read_inputs(self):
+        """Generator which yields the lines of the inputs in turn"""
+        for name in self.file_names:
+            yield from self.read_input(name)
+
+    @staticmethod
+    def read_files(names):
+        """Generator which yields the lines of several inputs in turn"""
+        for name in names:
+            yield from CrunchLog.read_lines(name)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
     def populate_entry_types(log_entry_module="petit3.processing.log_entries"):
         """
         Collects all known types of log entries from the log_entry_module
@@ -93,66 +384,102 @@ class CrunchLog(UserList):
         entry_types = [
             cls
             for name, cls in inspect.getmembers(
-                sys.modules[log_entry_module], inspect.isclass
+                importlib.import_module(log_entry_module), inspect.isclass
             )
             if name != "LogEntry"
         ]
 
         entry_types.sort(key=lambda x: x.order, reverse=True)
 
-        return entry_types
+        return tuple(entry_types)
+
+    @staticmethod
+    def formats():
+        """Returns the known types of log entries by format name"""
+        return {cls.format: cls for cls in CrunchLog.populate_entry_types()}
 
     @staticmethod
     @contextmanager
     def stream(s):
         if s == "<stdin>":
             yield sys.stdin
-        else:
+            return
+
+        codec = compression(s)
+
+        if codec is None:
             with open(s, "r") as f:
                 yield f
+        else:
+            # Decompressed by a read ahead thread while the lines are parsed
+            with open_compressed(s, codec) as f:
+                yield f
+
+    def sample(self, buf):
+        """Returns the lines used for format detection, the first lines of
+        the buffer and lines spread over the first file. Standard input
+        and compressed files are only sampled in the buffer, which holds
+        all of the lines of a log which is not streamed"""
+
+        head = buf[: self.detection_lines]
+
+        # The buffer only holds the start of a streamed file
+        if len(buf) >= self.detection_prefix and self.splittable:
+            name = self.file_names[0]
+            return head + spread_lines(
+                name, self.detection_strata, self.spans.get(name)
+            )
+
+        rest = buf[self.detection_lines :]
+
+        step = max(1, len(rest) // self.detection_strata)
+        strata = rest[step // 2 :: step][: self.detection_strata]
+
+        return head + strata
 
     def select_log_format(self, buf):
         """
         Determines which type of entry to use when building CrunchLog by
-        by sampling the buffer and using a quarum based on votes for each
-        log type
+        scoring a fixed sample of the buffer in one pass and using a quarum
+        based on votes for each log type. Without a quarum the type with
+        the most votes is used
         """
         assert len(buf) >= 1, "Buf is empty"
 
-        sample_lines = []
-        max_sample_lines = 10
+        sample_lines = [line.split() for line in self.sample(buf)]
         entry_types = CrunchLog.populate_entry_types()
-        t = Tally(entry_types, max_sample_lines)
+        t = Tally(entry_types, len(sample_lines))
+
+        # Build tallies for the sample, each line votes for the first type
+        for line in sample_lines:
+            for entry_type in entry_types:
+                if entry_type.is_type(line):
+                    t.append(entry_type)
+                    break
 
-        # Keep building samples until we get a good set
-        while True:
+        # Tally logic is determined by driver
+        for entry_type in entry_types:
+            if t.is_type(entry_type):
+                logging.info(
+                    "Determined " + str(entry_type) + ": " + str(t.matrix[entry_type])
+                )
 
-            # Get X number of samples
-            for i in range(0, max_sample_lines):
-                sample_lines.append(random.choice(buf).split())
+                return entry_type
 
-            # Build tallies for the collected samples
-            for line in sample_lines:
-                for entry_type in entry_types:
-                    if entry_type.is_type(line):
-                        t.append(entry_type)
-                        break
+        # Mixed input, fall back on raw entries if there are no votes at all
+        entry_type = max(entry_types, key=lambda x: t.matrix[x])
+        if not t.matrix[entry_type]:
+            entry_type = entry_types[-1]
 
-            # Tally logic is determined by driver
-            for entry_type in entry_types:
-                if t.is_type(entry_type):
-                    logging.info(
-                        "Determined "
-                        + str(entry_type)
-                        + ": "
-                        + str(t.matrix[entry_type])
-                    )
+        logging.info("Most votes " + str(entry_type) + ": " + str(t.matrix[entry_type]))
 
-                    return entry_type
+        return entry_type
 
     def contains(self, obj):
         """Determine what kind of objects are contained in this Log"""
-        if len(self) >= 1:
+        if self.streaming or self.columnar:
+            return issubclass(self.Entry, obj)
+        elif len(self) >= 1:
             return isinstance(self[len(self) - 1], obj)
         else:
             return False
@@ -163,14 +490,17 @@ class CrunchLog(UserList):
             entry.display()
 
     def subset(self, string):
-        """Return Log object with subset of entries based on a filter"""
+        """Return Log object with subset of entries based on a filter.
+        The subset of a columnar log is a view sharing its columns"""
 
-        newlog = CrunchLog()
-        for entry in self:
-            if re.search(string, entry.log_entry):
-                newlog.append(entry)
-
-        return newlog
+        regex = re.compile(string)
+        newlog = copy.copy(self)
 
+        if self.columnar:
+            rows = [entry.index for entry in self if regex.search(entry.log_entry)]
+            newlog._columns = self.columns.select(rows)
+        else:
+            newlog.data = [entry for entry in self if regex.search(entry.log_entry)]
+            newlog.streaming = False
 
-import inspect
+        return newlog
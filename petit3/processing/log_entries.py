@@ -1,24 +1,189 @@
 import datetime
 import logging
 import re
-import time
 
 logger = logging.getLogger(__name__)
 
+# Abbreviated month names as matched by time.strptime's %b
+MONTHS = {
+    name: number
+    for number, name in enumerate(
+        ["jan", "feb", "mar", "apr", "may", "jun"]
+        + ["jul", "aug", "sep", "oct", "nov", "dec"],
+        1,
+    )
+}
+
+# Strings accepted by int(), used to check fields without converting them
+INTEGER = r"[+-]?\d+(?:_\d+)*"
+INTEGER_RE = re.compile(INTEGER)
+CLOCK_RE = re.compile(f"{INTEGER}:{INTEGER}:{INTEGER}")
+
+# High precision time of rsyslog: 17:56:32.197716
+PRECISION_CLOCK_RE = re.compile(r"[0-9]{2}:[0-9]{2}:[0-9]{2}\.[0-9]{6}")
+
+# Timestamp used for lines without date/time information
+ABNORMAL_STAMP = (1900, 1, 1, 1, 1, 1)
+
+# Signatures which is_type looks for in the split words of a line
+MONTH_SIGNATURE = re.compile(r"[A-Z][a-z]{2}")
+DAY_SIGNATURE = re.compile(r"[0-9][0-9]?")
+CLOCK_SIGNATURE = re.compile(r"[0-9{2}:[0-9]{2}:[0-9]{2}")
+PAM_SIGNATURE = re.compile(r"^pam_")
+SSHD_SIGNATURE = re.compile(r"^sshd\[")
+ISO_DATE_SIGNATURE = re.compile("[0-9]{4}-[0-9]{2}-[0-9]{2}T")
+APACHE_ACCESS_SIGNATURE = re.compile(
+    r"[0-9]{2}/[a-zA-Z]{3}/[0-9]{4}:[0-9{2}:[0-9]{2}:[0-9]{2}"
+)
+APACHE_WEEKDAY_SIGNATURE = re.compile(r"[\[a-zA-Z]{3}")
+APACHE_CLOCK_SIGNATURE = re.compile(r"[0-9]{2}:[0-9]{2}:[0-9]{2}")
+YEAR_SIGNATURE = re.compile(r"[0-9]{4}")
+SNORT_SIGNATURE = re.compile(
+    r"[0-9]{2}\/[0-9]{2}\-[0-9]{2}\:[0-9]{2}\:[0-9]{2}\.[0-9]{6}"
+)
+
+
+def month_number(name):
+    """Converts an abbreviated month name like Feb to its number"""
+
+    try:
+        return MONTHS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown month: {name}")
+
+
+def check_integer(string):
+    """Raises ValueError unless int() can convert the string"""
+
+    if not INTEGER_RE.fullmatch(string):
+        raise ValueError(f"Not an integer: {string}")
+
+
+def check_month(name):
+    """Raises ValueError unless the string is an abbreviated month name"""
+
+    if name.lower() not in MONTHS:
+        raise ValueError(f"Unknown month: {name}")
+
+
+def check_clock(clocktime):
+    """Raises ValueError unless the string looks like 11:53:08"""
+
+    if not CLOCK_RE.fullmatch(clocktime):
+        raise ValueError(f"Not a time: {clocktime}")
+
+
+def abnormal_fields(value):
+    """Host, daemon and payload of a line without date/time information"""
+
+    if len(value) >= 1:
+        return ["#", "#", " ".join(value)]
+
+    # Blank line, will be sorted out by scrub
+    return ["#", "#", "#"]
+
 
 class LogEntry:
     """Interface class which specifies generic log format for consumption
-    by other classes"""
-
-    year = 0
-    month = 0
-    day = 0
-    hour = 0
-    minute = 0
-    second = 0
-    host = 0
-    daemon = 0
-    log_entry = 0
+    by other classes
+
+    Entries only hold the raw line. A line is checked when the entry is
+    built, but the timestamp components and the host, daemon and payload
+    fields are parsed the first time they are used, so that hash modes
+    never convert timestamps and graph modes never build payloads.
+
+    Entries of a memory mapped log also refer to their line in the
+    mapping through source, a (MappedFile, offset) pair, so that samples
+    can keep the reference instead of the entry. Changing a field drops
+    the reference, as the entry no longer matches its line.
+
+    """
+
+    __slots__ = ("line", "_stamp", "_fields", "source")
+
+    def __init__(self, line):
+        self.line = line
+        self._stamp = None
+        self._fields = None
+        self.source = None
+
+        # Fail early on lines which cannot be parsed
+        self.check()
+
+    def check(self):
+        """Raises ValueError if the line cannot be parsed"""
+        pass
+
+    def parse_stamp(self):
+        """Returns year, month, day, hour, minute and second"""
+        return ABNORMAL_STAMP
+
+    def parse_fields(self):
+        """Returns a list of host, daemon and payload"""
+        return abnormal_fields(self.line.split())
+
+    @property
+    def stamp(self):
+        if self._stamp is None:
+            self._stamp = self.parse_stamp()
+        return self._stamp
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._fields = self.parse_fields()
+        return self._fields
+
+    @property
+    def year(self):
+        return self.stamp[0]
+
+    @property
+    def month(self):
+        return self.stamp[1]
+
+    @property
+    def day(self):
+        return self.stamp[2]
+
+    @property
+    def hour(self):
+        return self.stamp[3]
+
+    @property
+    def minute(self):
+        return self.stamp[4]
+
+    @property
+    def second(self):
+        return self.stamp[5]
+
+    @property
+    def host(self):
+        return self.fields[0]
+
+    @host.setter
+    def host(self, value):
+        self.fields[0] = value
+        self.source = None
+
+    @property
+    def daemon(self):
+        return self.fields[1]
+
+    @daemon.setter
+    def daemon(self, value):
+        self.fields[1] = value
+        self.source = None
+
+    @property
+    def log_entry(self):
+        return self.fields[2]
+
+    @log_entry.setter
+    def log_entry(self, value):
+        self.fields[2] = value
+        self.source = None
 
     def display(self):
         print(
@@ -47,90 +212,53 @@ class LogEntry:
         else:
             return False
 
-    def set_abnormal(self, value):
-        (
-            self.year,
-            self.month,
-            self.day,
-            self.hour,
-            self.minute,
-            self.second,
-            self.host,
-            self.daemon,
-        ) = [1900, 1, 1, 1, 1, 1, "#", "#"]
-        self.log_entry = " ".join(value)
-
-    def set_blank(self):
-        (
-            self.year,
-            self.month,
-            self.day,
-            self.hour,
-            self.minute,
-            self.second,
-            self.host,
-            self.daemon,
-        ) = [1900, 1, 1, 1, 1, 1, "#", "#"]
-        self.log_entry = "#"
-
 
 class SyslogEntry(LogEntry):
     """Driver for Syslog. Conforms to LogEntry interface class."""
 
+    __slots__ = ()
+
     order = 0
+    format = "syslog"
 
-    def __init__(self, line):
+    def check(self):
+        # Split off the fields up to the payload
+        value = self.line.split(None, 5)
 
-        # Split the line up
-        value = line.split()
+        # Should be normal log entry, look like: "Feb 29 11:53:08"
+        if len(value) >= 5:
+            check_month(value[0])
+            check_integer(value[1])
+            check_clock(value[2])
+
+    def parse_stamp(self):
+        value = self.line.split(None, 5)
 
-        # Should be normal log entry
         if len(value) >= 5:
+            month, day, clocktime = value[:3]
+            hour, minute, second = clocktime.split(":")
 
             # Syslog does not store year information so, set to current year
-            self.year = str(datetime.date.today().year)
-            self.month, self.day, clocktime, self.host, self.daemon = value[:5]
-            self.log_entry = " ".join(value[5:])
-            self.hour, self.minute, self.second = clocktime.split(":")
-
-            # Convert month to integer
-            self.month = str(time.strptime(self.month, "%b")[1])
-
-            # Normalize integers to standard widths and convert to strings
-            self.year = int(self.year)
-            self.month = int(self.month)
-            self.day = int(self.day)
-            self.hour = int(self.hour)
-            self.minute = int(self.minute)
-            self.second = int(self.second)
-
-        # Abnormal log entry
-        elif len(value) >= 1:
-            (
-                self.year,
-                self.month,
-                self.day,
-                self.hour,
-                self.minute,
-                self.second,
-                self.host,
-                self.daemon,
-            ) = [1900, 1, 1, 1, 1, 1, "#", "#"]
-            self.log_entry = " ".join(value)
-
-        # Blank line, will be sorted out by scrub
-        else:
-            (
-                self.year,
-                self.month,
-                self.day,
-                self.hour,
-                self.minute,
-                self.second,
-                self.host,
-                self.daemon,
-            ) = [1900, 1, 1, 1, 1, 1, "#", "#"]
-            self.log_entry = "#"
+            return (
+                datetime.date.today().year,
+                month_number(month),
+                int(day),
+                int(hour),
+                int(minute),
+                int(second),
+            )
+
+        # Abnormal log entry or blank line
+        return ABNORMAL_STAMP
+
+    def parse_fields(self):
+        value = self.line.split()
+
+        if len(value) >= 5:
+            return [value[3], value[4], " ".join(value[5:])]
+
+        # Abnormal log entry or blank line
+        return abnormal_fields(value)
 
     @staticmethod
     def is_type(line):
@@ -141,10 +269,12 @@ class SyslogEntry(LogEntry):
             # Look for something similar to: "Feb 29 11:53:08" in first
             # three columns
             if (
-                re.search(r"[A-Z][a-z]{2}", line[0])
-                and re.search(r"[0-9][0-9]?", line[1])
-                and re.search(r"[0-9{2}:[0-9]{2}:[0-9]{2}", line[2])
-                and not (re.search(r"^pam_", line[5]) or re.search(r"^sshd\[", line[4]))
+                MONTH_SIGNATURE.search(line[0])
+                and DAY_SIGNATURE.search(line[1])
+                and CLOCK_SIGNATURE.search(line[2])
+                and not (
+                    PAM_SIGNATURE.search(line[5]) or SSHD_SIGNATURE.search(line[4])
+                )
             ):
                 return True
             else:
@@ -156,72 +286,58 @@ class SyslogEntry(LogEntry):
 class RSyslogEntry(LogEntry):
     """Driver for RSyslog. Conforms to LogEntry interface class."""
 
+    __slots__ = ()
+
     order = 0
+    format = "rsyslog"
 
-    def __init__(self, line):
+    def check(self):
+        # The high precision timestamp has no cheaper check than parsing
+        # it, so the parsed timestamp is kept
+        self._stamp = self.parse_stamp()
 
-        # Split the line up
-        value = line.split()
+    def parse_stamp(self):
+        value = self.line.split(None, 4)
 
-        # Should be normal log entry
-        if len(value) >= 5:
+        if len(value) < 5:
+            # Abnormal log entry or blank line
+            return ABNORMAL_STAMP
 
-            # Complete major splits: 2010-06-24T17:56:32.197716-04:00
-            date, rtime = value[0].split("T")  # Raw time
+        # Complete major splits: 2010-06-24T17:56:32.197716-04:00
+        date, rtime = value[0].split("T")  # Raw time
 
-            # High precision time with timezone info: 17:56:32.197716-04:00
-            hptime, offset = rtime.split("-")
+        # High precision time with timezone info: 17:56:32.197716-04:00
+        hptime, offset = rtime.split("-")
 
-            # Patch for mixed enviornments, milliseconds do not get logged
-            # if older Ubuntu 8.04 boxes log to a newer 10.04 server with
-            # Rsyslog precision time on.
-            if re.search(r"[0-9]{2}:[0-9]{2}:[0-9]{2}\.[0-9]{6}", hptime):
-                time, mseconds = hptime.split(".")  # Miliseconds
-            else:
-                time = hptime
-
-            # Complete secondary splits
-            self.year, self.month, self.day = date.split("-")
-            self.hour, self.minute, self.second = time.split(":")
-            self.host = value[1]
-            self.daemon = value[2]
-            self.log_entry = " ".join(value[3:])
-
-            # Normalize integers to standard widths and convert to strings
-            self.year = int(self.year)
-            self.month = int(self.month)
-            self.day = int(self.day)
-            self.hour = int(self.hour)
-            self.minute = int(self.minute)
-            self.second = int(self.second)
-
-        # Abnormal log entry
-        elif len(value) >= 1:
-            (
-                self.year,
-                self.month,
-                self.day,
-                self.hour,
-                self.minute,
-                self.second,
-                self.host,
-                self.daemon,
-            ) = [1900, 1, 1, 1, 1, 1, "#", "#"]
-            self.log_entry = " ".join(value)
-
-        # Blank line, will be sorted out by scrub
+        # Patch for mixed enviornments, milliseconds do not get logged
+        # if older Ubuntu 8.04 boxes log to a newer 10.04 server with
+        # Rsyslog precision time on.
+        if PRECISION_CLOCK_RE.search(hptime):
+            time, mseconds = hptime.split(".")  # Miliseconds
         else:
-            (
-                self.year,
-                self.month,
-                self.day,
-                self.hour,
-                self.minute,
-                self.second,
-                self.host,
-                self.daemon,
-            ) = [1900, 1, 1, 1, 1, 1, "#", "#"]
-            self.log_entry = "#"
+            time = hptime
+
+        # Complete secondary splits
+        year, month, day = date.split("-")
+        hour, minute, second = time.split(":")
+
+        return (
+            int(year),
+            int(month),
+            int(day),
+            int(hour),
+            int(minute),
+            int(second),
+        )
+
+    def parse_fields(self):
+        value = self.line.split()
+
+        if len(value) >= 5:
+            return [value[1], value[2], " ".join(value[3:])]
+
+        # Abnormal log entry or blank line
+        return abnormal_fields(value)
 
     @staticmethod
     def is_type(line):
@@ -230,7 +346,7 @@ class RSyslogEntry(LogEntry):
         if len(line) >= 1:
 
             # Look for something similar to: "2011-04-04T"
-            if re.search("[0-9]{4}-[0-9]{2}-[0-9]{2}T", line[0]):
+            if ISO_DATE_SIGNATURE.search(line[0]):
                 return True
             else:
                 return False
@@ -241,63 +357,64 @@ class RSyslogEntry(LogEntry):
 class ApacheAccessEntry(LogEntry):
     """Driver for Apache Access formatted log files"""
 
+    __slots__ = ()
+
     order = 0
+    format = "apache-access"
 
-    def __init__(self, line):
+    @staticmethod
+    def split_date(apachedate):
+        """Split up something that looks like this: [03/Aug/2009:11:53:08"""
 
-        # Split the line up
-        value = line.split()
+        datetime = apachedate.split(":")
+        if len(datetime) < 4:
+            raise ValueError(f"Not an apache date: {apachedate}")
+
+        dmy = datetime[0].split("/")
+        if len(dmy) < 3:
+            raise ValueError(f"Not an apache date: {apachedate}")
+
+        # Day, month, year, hour, minute, second
+        return [dmy[0].replace("[", ""), dmy[1], dmy[2]] + datetime[1:4]
+
+    def check(self):
+        value = self.line.split(None, 12)
 
         # Should be normal log entry
         if len(value) >= 12:
-            # Grab major chunks from the line
-            (
-                rhost,
-                ident,
-                ruser,
-                apachedate,
-                junk,
-                junk2,
-                uri,
-                protocol,
-                status,
-                bytes,
-                referer,
-                agent,
-            ) = value[:12]
-            self.log_entry = uri
-
-            # Split up something that looks like this: [03/Aug/2009:11:53:08
-            datetime = apachedate.split(":")
-            date = datetime[0]
-            self.hour = datetime[1]
-            self.minute = datetime[2]
-            self.second = datetime[3]
-            dmy = date.split("/")
-            self.day = re.sub(r"\[", "", dmy[0])
-            self.month = dmy[1]
-            self.year = dmy[2]
-            self.host = uri
-            daemon = "webserver"
-
-            # Convert month to integer
-            self.month = time.strptime(self.month, "%b")[1]
-
-            # Normalize integers to standard widths and convert to strings
-            self.year = int(self.year)
-            self.month = int(self.month)
-            self.day = int(self.day)
-            self.hour = int(self.hour)
-            self.minute = int(self.minute)
-            self.second = int(self.second)
-
-        # Abnormal log entry
-        elif len(value) >= 1:
-            self.set_abnormal(value)
-
-        # Blank line, will be sorted out by scrub
-        else:
-            self.set_blank()
+            day, month, year, hour, minute, second = self.split_date(value[3])
+
+            check_month(month)
+            for field in (year, day, hour, minute, second):
+                check_integer(field)
+
+    def parse_stamp(self):
+        value = self.line.split(None, 12)
+
+        if len(value) >= 12:
+            day, month, year, hour, minute, second = self.split_date(value[3])
+
+            return (
+                int(year),
+                month_number(month),
+                int(day),
+                int(hour),
+                int(minute),
+                int(second),
+            )
+
+        # Abnormal log entry or blank line
+        return ABNORMAL_STAMP
+
+    def parse_fields(self):
+        value = self.line.split(None, 12)
+
+        # The requested uri serves as host and payload
+        if len(value) >= 12:
+            return [value[6], "", value[6]]
+
+        # Abnormal log entry or blank line
+        return abnormal_fields(self.line.split())
 
     @staticmethod
     def is_type(line):
@@ -306,8 +423,7 @@ class ApacheAccessEntry(LogEntry):
         if len(line) >= 4:
 
             # Look for: "03/Aug/2009:11:53:08" in forth column
-            r = r"[0-9]{2}/[a-zA-Z]{3}/[0-9]{4}:[0-9{2}:[0-9]{2}:[0-9]{2}"
-            if re.search(r, line[3]):
+            if APACHE_ACCESS_SIGNATURE.search(line[3]):
                 return True
             else:
                 return False
@@ -318,42 +434,50 @@ class ApacheAccessEntry(LogEntry):
 class ApacheErrorEntry(LogEntry):
     """Driver for Apache Error formatted log files"""
 
+    __slots__ = ()
+
     order = 0
+    format = "apache-error"
 
-    def __init__(self, line):
+    def check(self):
+        value = self.line.split(None, 5)
 
-        # Split the line up
-        value = line.split()
+        # Should be normal log entry: [Sat Feb 27 12:16:10 2010]
+        if len(value) >= 5:
+            junk, month, day, clocktime, year = value[:5]
+
+            check_month(month)
+            check_integer(day)
+            check_clock(clocktime)
+            check_integer(year.replace("]", ""))
+
+    def parse_stamp(self):
+        value = self.line.split(None, 5)
 
-        # Should be normal log entry
         if len(value) >= 5:
-            # Grab major chunks from the line
-            # Split up something that looks like this:
-            # [Sat Feb 27 12:16:10 2010]
-            junk, self.month, self.day, clocktime, self.year = value[:5]
-            self.log_entry = " ".join(value[5:])
-            self.hour, self.minute, self.second = clocktime.split(":")
-
-            # Convert month to integer
-            self.month = time.strptime(self.month, "%b")[1]
-
-            # Clean up the year field
-            self.year = re.sub(r"\]", "", self.year)
-
-            # Normalize integers to standard widths and convert to strings
-            self.year = int(self.year)
-            self.month = int(self.month)
-            self.day = int(self.day)
-            self.hour = int(self.hour)
-            self.minute = int(self.minute)
-            self.second = int(self.second)
-        # Abnormal log entry
-        elif len(value) >= 1:
-            self.set_abnormal(value)
-
-        # Blank line, will be sorted out by scrub
-        else:
-            self.set_blank()
+            junk, month, day, clocktime, year = value[:5]
+            hour, minute, second = clocktime.split(":")
+
+            return (
+                int(year.replace("]", "")),
+                month_number(month),
+                int(day),
+                int(hour),
+                int(minute),
+                int(second),
+            )
+
+        # Abnormal log entry or blank line
+        return ABNORMAL_STAMP
+
+    def parse_fields(self):
+        value = self.line.split()
+
+        if len(value) >= 5:
+            return ["", "", " ".join(value[5:])]
+
+        # Abnormal log entry or blank line
+        return abnormal_fields(value)
 
     @staticmethod
     def is_type(line):
@@ -363,9 +487,9 @@ class ApacheErrorEntry(LogEntry):
 
             # Look for : [Sat Feb 27 12:16:10 2010]
             if (
-                re.search(r"[\[a-zA-Z]{3}", line[0])
-                and re.search(r"[0-9]{2}:[0-9]{2}:[0-9]{2}", line[3])
-                and re.search(r"[0-9]{4}", line[4])
+                APACHE_WEEKDAY_SIGNATURE.search(line[0])
+                and APACHE_CLOCK_SIGNATURE.search(line[3])
+                and YEAR_SIGNATURE.search(line[4])
             ):
                 return True
             else:
@@ -377,39 +501,15 @@ class ApacheErrorEntry(LogEntry):
 class SecureLogEntry(LogEntry):
     """Driver for Syslog. Conforms to LogEntry interface class."""
 
-    order = 0
-
-    def __init__(self, line):
+    __slots__ = ()
 
-        # Split the line up
-        value = line.split()
+    order = 0
+    format = "secure"
 
-        # Should be normal log entry
-        if len(value) >= 5:
-            # Syslog does not store year information so, set to current year
-            self.year = str(datetime.date.today().year)
-            self.month, self.day, clocktime, self.host, self.daemon = value[:5]
-            self.log_entry = " ".join(value[5:])
-            self.hour, self.minute, self.second = clocktime.split(":")
-
-            # Convert month to integer
-            self.month = str(time.strptime(self.month, "%b")[1])
-
-            # Normalize integers to standard widths
-            self.year = int(self.year)
-            self.month = int(self.month)
-            self.day = int(self.day)
-            self.hour = int(self.hour)
-            self.minute = int(self.minute)
-            self.second = int(self.second)
-
-        # Abnormal log entry
-        elif len(value) >= 1:
-            self.set_abnormal(value)
-
-        # Blank line, will be sorted out by scrub
-        else:
-            self.set_blank()
+    # Secure logs are laid out like syslog
+    check = SyslogEntry.check
+    parse_stamp = SyslogEntry.parse_stamp
+    parse_fields = SyslogEntry.parse_fields
 
     @staticmethod
     def is_type(line):
@@ -419,9 +519,9 @@ class SecureLogEntry(LogEntry):
 
             # Look for something similar to: "29 11:53:08" in third column
             if (
-                re.search(r"[0-9][0-9]?", line[1])
-                and re.search(r"[0-9{2}:[0-9]{2}:[0-9]{2}", line[2])
-                and (re.search(r"^pam_", line[5]) or re.search(r"^sshd\[", line[4]))
+                DAY_SIGNATURE.search(line[1])
+                and CLOCK_SIGNATURE.search(line[2])
+                and (PAM_SIGNATURE.search(line[5]) or SSHD_SIGNATURE.search(line[4]))
             ):
                 return True
             else:
@@ -446,53 +546,58 @@ class ScriptlogEntry(LogEntry):
     are used with scriptlogs.
     """
 
+    __slots__ = ()
+
     order = 0
+    format = "scriptlog"
 
-    # Extra variables
-    label = "__none__"
-    id = "__none__"
-    type = "__none__"
+    def check(self):
+        # Parsing the timestamp checks the line, so it is kept
+        self._stamp = self.parse_stamp()
 
-    def __init__(self, line):
+    def parse_stamp(self):
+        value = self.line.split(None, 8)
 
-        # Split the line up
-        value = line.split()
-
-        # Should be normal log entry
         if len(value) >= 5:
+            # Scriptlogs carry three extra fields after the daemon
+            month, day, time, host, daemon, label, id, type = value[:8]
+            hour, minute, second = time.split(":")
 
             # Syslog does not store year information so scriptlog does not
-            # So set to current year, set the other fields normally
-            self.year = datetime.date.today().year
-            (
-                self.month,
-                self.day,
-                time,
-                self.host,
-                self.daemon,
-                self.label,
-                self.id,
-                self.type,
-            ) = value[:8]
-
-            self.log_entry = " ".join(value[8:])
-            self.hour, self.minute, self.second = time.split(":")
-
-            # Normalize integers to standard widths and convert to strings
-            self.year = int(self.year)
-            self.month = int(self.month)
-            self.day = int(self.day)
-            self.hour = int(self.hour)
-            self.minute = int(self.minute)
-            self.second = int(self.second)
-
-        # Abnormal log entry
-        elif len(value) >= 1:
-            self.set_abnormal(value)
-
-        # Blank line, will be sorted out by scrub
-        else:
-            self.set_blank()
+            # So set to current year
+            return (
+                datetime.date.today().year,
+                int(month),
+                int(day),
+                int(hour),
+                int(minute),
+                int(second),
+            )
+
+        # Abnormal log entry or blank line
+        return ABNORMAL_STAMP
+
+    def parse_fields(self):
+        value = self.line.split()
+
+        # Host, daemon, payload, label, id and type
+        if len(value) >= 5:
+            return [value[3], value[4], " ".join(value[8:])] + value[5:8]
+
+        # Abnormal log entry or blank line
+        return abnormal_fields(value) + ["__none__"] * 3
+
+    @property
+    def label(self):
+        return self.fields[3]
+
+    @property
+    def id(self):
+        return self.fields[4]
+
+    @property
+    def type(self):
+        return self.fields[5]
 
     @staticmethod
     def is_type(line, label="__none__"):
@@ -517,50 +622,52 @@ class SnortEntry(LogEntry):
     Driver for Snort formatted log files. Conforms to LogEntry interface class.
     """
 
+    __slots__ = ()
+
     order = 0
+    format = "snort"
 
-    def __init__(self, line):
+    def check(self):
+        # Parsing the timestamp checks the line, so it is kept
+        self._stamp = self.parse_stamp()
 
-        # Split the line up
-        value = line.split()
+    def parse_stamp(self):
+        value = self.line.split(None, 1)
 
-        # Should be normal log entry
         if len(value) >= 2:
-
-            # Snort does not store year information so, set to current year
-            self.year = datetime.date.today().year
-
-            # Initial break down
-            snortdate = value[:1]
-            self.log_entry = " ".join(value[1:])
-
             # Looks like "09/29-10:18:46.026172"
-            snortdate, junk = snortdate[0].split(".")
+            snortdate, junk = value[0].split(".")
 
             # Looks like "09/29-10:18:46"
-            self.month, snortdate = snortdate.split("/")
+            month, snortdate = snortdate.split("/")
 
             # Looks like "29-10:18:46"
-            self.day, snortdate = snortdate.split("-")
+            day, snortdate = snortdate.split("-")
 
             # Looks like "10:18:46"
-            self.hour, self.minute, self.second = snortdate.split(":")
+            hour, minute, second = snortdate.split(":")
 
-            # Normalize integers to standard widths and convert to strings
-            self.year = int(self.year)
-            self.month = int(self.month)
-            self.day = int(self.day)
-            self.hour = int(self.hour)
-            self.minute = int(self.minute)
-            self.second = int(self.second)
+            # Snort does not store year information so, set to current year
+            return (
+                datetime.date.today().year,
+                int(month),
+                int(day),
+                int(hour),
+                int(minute),
+                int(second),
+            )
 
-        # Abnormal value
-        elif len(value) >= 1:
-            self.set_abnormal(value)
+        # Abnormal value or blank line
+        return ABNORMAL_STAMP
 
-        # Blank line, will be sorted out by scrub
-        else:
-            self.set_blank()
+    def parse_fields(self):
+        value = self.line.split()
+
+        if len(value) >= 2:
+            return ["", "", " ".join(value[1:])]
+
+        # Abnormal value or blank line
+        return abnormal_fields(value)
 
     @staticmethod
     def is_type(line):
@@ -568,8 +675,7 @@ class SnortEntry(LogEntry):
         if len(line) >= 4:
 
             # Look for : "09/29-10:18:46.026172" in first column
-            r = r"[0-9]{2}\/[0-9]{2}\-[0-9]{2}\:[0-9]{2}\:[0-9]{2}\.[0-9]{6}"
-            if re.search(r, line[0]):
+            if SNORT_SIGNATURE.search(line[0]):
                 return True
             else:
                 return False
@@ -586,20 +692,10 @@ class RawEntry(LogEntry):
     values
     """
 
-    order = -1
-
-    def __init__(self, line):
-
-        # Split the line up
-        value = line.split()
-
-        # Fake the time/date values, put the entire line in the key
-        if len(value) >= 1:
-            self.set_abnormal(value)
+    __slots__ = ()
 
-        # Blank line, will be sorted out by scrub
-        else:
-            self.set_blank()
+    order = -1
+    format = "raw"
 
     @staticmethod
     def is_type(line):
@@ -610,7 +706,7 @@ class RawEntry(LogEntry):
         if len(line) >= 1:
 
             # Look for any length of text in the line
-            if re.search(".+", str(line)):
+            if str(line):
                 return True
             else:
                 return False
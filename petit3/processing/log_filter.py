@@ -4,12 +4,253 @@ import logging
 import os
 import re
 import sys
+from functools import lru_cache
+
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
 
 logger = logging.getLogger(__name__)
 
 PRECEEDING_DIR = "/var/lib/petit/"
 FILTERS = "filters"
 
+# Scrubbed tokens kept by a TokenScrubber
+TOKEN_CACHE_SIZE = 2**16
+
+
+class ScrubEngine:
+    """Compiled form of an ordered list of stopwords
+
+    Consecutive stopwords are fused into one alternation when they are
+    independent, that is when they only match characters from disjoint
+    sets which never include the scrub character. Their matches can then
+    never overlap, so one pass over the string gives the same result as
+    one pass per stopword. Stopwords which work on the output of earlier
+    ones, such as the collapsing #+ and #( #)+ rules, are applied one by
+    one afterwards in file order. Plain words are replaced with str
+    methods instead of the regular expression engine.
+
+    """
+
+    def __init__(self, stopwords):
+        # Each stage is a (literal, regex) pair, only one of which is set
+        self.stages = []
+
+        run, run_chars = [], []
+        for stopword in stopwords:
+            chars = self.alphabet(stopword)
+
+            if chars is not None and not any(
+                self.overlaps(chars, other) for other in run_chars
+            ):
+                run.append(stopword)
+                run_chars.append(chars)
+                continue
+
+            self.fuse(run)
+            run, run_chars = [], []
+
+            if chars is not None:
+                run.append(stopword)
+                run_chars.append(chars)
+            else:
+                self.fuse([stopword])
+
+        self.fuse(run)
+
+    @staticmethod
+    def alphabet(stopword):
+        """Returns the character ranges a stopword can match, or None when
+        the stopword cannot safely share a pass with other stopwords"""
+
+        if stopword.flags & re.IGNORECASE or stopword.match(""):
+            return None
+
+        try:
+            chars = ScrubEngine.parsed_alphabet(sre_parse.parse(stopword.pattern))
+        except (re.error, TypeError, ValueError):
+            return None
+
+        # Rules touching the scrub character depend on earlier rules
+        if chars is None or ScrubEngine.overlaps(chars, [(35, 35)]):
+            return None
+
+        return chars
+
+    @staticmethod
+    def parsed_alphabet(parsed):
+        """Collects the character ranges of a parsed expression, anchors,
+        lookarounds, back references and classes like \\w return None"""
+
+        chars = []
+        for op, av in parsed:
+            op = str(op)
+
+            if op == "LITERAL":
+                chars.append((av, av))
+
+            elif op == "IN":
+                for item_op, item_av in av:
+                    item_op = str(item_op)
+                    if item_op == "LITERAL":
+                        chars.append((item_av, item_av))
+                    elif item_op == "RANGE":
+                        chars.append(item_av)
+                    else:
+                        return None
+
+            elif op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+                sub = ScrubEngine.parsed_alphabet(av[2])
+                if sub is None:
+                    return None
+                chars.extend(sub)
+
+            elif op in ("SUBPATTERN", "ATOMIC_GROUP"):
+                sub = ScrubEngine.parsed_alphabet(
+                    av if op == "ATOMIC_GROUP" else av[-1]
+                )
+                if sub is None:
+                    return None
+                chars.extend(sub)
+
+            elif op == "BRANCH":
+                for branch in av[1]:
+                    sub = ScrubEngine.parsed_alphabet(branch)
+                    if sub is None:
+                        return None
+                    chars.extend(sub)
+
+            else:
+                return None
+
+        return chars
+
+    @staticmethod
+    def overlaps(chars, other):
+        """Determine if two lists of character ranges share a character"""
+        return any(
+            lo <= o_hi and o_lo <= hi for lo, hi in chars for o_lo, o_hi in other
+        )
+
+    @staticmethod
+    def literal(stopword):
+        """Returns the plain string a stopword matches, or None"""
+
+        if stopword.flags & re.IGNORECASE:
+            return None
+
+        try:
+            parsed = sre_parse.parse(stopword.pattern)
+        except re.error:
+            return None
+
+        if all(str(op) == "LITERAL" for op, av in parsed):
+            return "".join(chr(av) for op, av in parsed)
+
+        return None
+
+    def fuse(self, run):
+        """Adds a run of independent stopwords as a single stage"""
+
+        if len(run) == 1:
+            literal = self.literal(run[0])
+            self.stages.append((literal, None if literal is not None else run[0]))
+
+        elif len(run) > 1:
+            pattern = "|".join(f"(?:{stopword.pattern})" for stopword in run)
+            self.stages.append((None, re.compile(pattern, re.DOTALL)))
+
+    @staticmethod
+    def local(stopword):
+        """Determine if a stopword never matches a space, so that scrubbing
+        the tokens of a string one by one gives the same result"""
+
+        if stopword.flags & re.IGNORECASE or stopword.match(""):
+            return False
+
+        try:
+            chars = ScrubEngine.parsed_alphabet(sre_parse.parse(stopword.pattern))
+        except (re.error, TypeError, ValueError):
+            return False
+
+        return chars is not None and not ScrubEngine.overlaps(chars, [(32, 32)])
+
+    def scrub(self, string):
+        """Replaces matches of each stage with the scrub character"""
+        for literal, regex in self.stages:
+            if regex is not None:
+                string = regex.sub("#", string)
+            elif literal in string:
+                string = string.replace(literal, "#")
+
+        return string
+
+
+class TokenScrubber:
+    """Scrubs the space separated tokens of a string one by one, keeping
+    the scrubbed form of the most recently seen tokens in a bounded cache
+
+    Payloads repeat the same daemons, hosts and words, so most tokens are
+    found in the cache. The stopwords which never match a space are
+    applied to the tokens. Stopwords which may match a space, like the
+    -- MARK -- stopword, are applied to the string before it is split
+    when they are independent of the token stopwords before them, like
+    the stopwords ScrubEngine fuses. From the first stopword which is
+    neither, such as the collapsing #( #)+ rule, the stopwords are applied
+    to the joined string afterwards. This gives the same result as
+    applying the stopwords in file order.
+
+    """
+
+    def __init__(self, stopwords, size=TOKEN_CACHE_SIZE):
+        before, tokens, after = [], [], []
+        tokens_chars = []
+
+        for i, stopword in enumerate(stopwords):
+            if ScrubEngine.local(stopword):
+                tokens.append(stopword)
+                tokens_chars.append(ScrubEngine.alphabet(stopword))
+                continue
+
+            chars = ScrubEngine.alphabet(stopword)
+            if chars is not None and not any(
+                other is None or ScrubEngine.overlaps(chars, other)
+                for other in tokens_chars
+            ):
+                before.append(stopword)
+                continue
+
+            after = stopwords[i:]
+            break
+
+        self.before = ScrubEngine(before)
+        self.tokens = ScrubEngine(tokens)
+        self.after = ScrubEngine(after)
+
+        self.scrub_token = lru_cache(maxsize=size)(self.scrub_uncached)
+
+    def scrub_uncached(self, token):
+        return self.tokens.scrub(token)
+
+    def scrub(self, string):
+        """Scrubs the string, its tokens, then the joined string"""
+
+        string = self.before.scrub(string)
+        string = " ".join(map(self.scrub_token, string.split(" ")))
+
+        return self.after.scrub(string)
+
+    def hit_rate(self):
+        """Returns the hits, the lookups and the fraction of lookups found
+        in the cache"""
+
+        info = self.scrub_token.cache_info()
+        lookups = info.hits + info.misses
+
+        return info.hits, lookups, info.hits / lookups if lookups else 0.0
+
 
 class Filter:
     """Filter object used to load filters into memory once, to save on file operations"""
@@ -22,6 +263,12 @@ class Filter:
     ]
 
     stopwords = []
+    engine = ScrubEngine(stopwords)
+
+    # Scrub the tokens of strings one by one with a cache, set by
+    # --scrub-tokens
+    by_token = False
+    tokens = None
 
     def __init__(self, _file=None):
 
@@ -49,22 +296,172 @@ class Filter:
                     print("Could not open Filter file", self._file)
                     sys.exit(16)
 
+        # Compile the stopwords into as few passes as possible
+        self.engine = ScrubEngine(self.stopwords)
+
         logger.info("Filter File: " + str(self._file))
+        logger.info(
+            f"Scrubbing {len(self.stopwords)} stopwords "
+            f"in {len(self.engine.stages)} passes"
+        )
+
+        if self.by_token:
+            self.tokens = TokenScrubber(self.stopwords)
+            logger.info(
+                f"Scrubbing tokens in {len(self.tokens.tokens.stages)} passes, "
+                f"strings in {len(self.tokens.before.stages)} passes before "
+                f"and {len(self.tokens.after.stages)} after"
+            )
 
     def scrub(self, string):
         """Used to remove entries and replace them with the scrub character"""
+
+        if self.tokens is not None:
+            scrubbed = self.tokens.scrub(string)
+        else:
+            scrubbed = self.engine.scrub(string)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(" SCRUBBING " + string + " BECOMES " + scrubbed)
+
+        return scrubbed
+
+    def report(self):
+        """Logs the hit rate of the token cache"""
+
+        if self.tokens is None:
+            return
+
+        hits, lookups, rate = self.tokens.hit_rate()
+        if lookups:
+            logger.info(
+                f"Token cache of {self._file}: {hits} hits "
+                f"in {lookups} lookups ({rate:.1%})"
+            )
+
+    def scrub_sequential(self, string):
+        """Reference scrubber which applies one stopword per pass, used
+        for debugging and to check the compiled engine"""
+
+        debug = logger.isEnabledFor(logging.DEBUG)
+
         # Check each stopword against each key
         for stopword in self.stopwords:
             # Replace matches with hash signs
             old_string = string
-            string = re.sub(stopword, "#", string)
-            logger.debug(
-                " SCRUBBING "
-                + old_string
-                + " OF "
-                + stopword.pattern
-                + " BECOMES "
-                + string
+            string = stopword.sub("#", string)
+
+            if debug:
+                logger.debug(
+                    " SCRUBBING "
+                    + old_string
+                    + " OF "
+                    + stopword.pattern
+                    + " BECOMES "
+                    + string
+                )
+
+        return string
+
+
+class RuleTable:
+    """Ordered rewrite rules loaded from a rules file, each line holding a
+    regular expression and its replacement separated by a tab. Each rule
+    replaces every match in the output of the rules before it, like
+    re.sub.
+
+    Rules are compiled once. Most rules start with a literal, e.g.
+    "Accepted password for", and only apply to strings containing it. One
+    alternation of the literals skips the strings no rule applies to, and
+    the others are only matched against the rules whose literal they
+    contain. Rules like "Invalid user.*", a literal followed by the rest
+    of the line, are applied with str methods instead of the regular
+    expression engine.
+
+    """
+
+    def __init__(self, _file):
+        # Each rule is a (literal, tail, regex, replacement) tuple, where
+        # tail tells whether the rule replaces the rest of the line
+        self.rules = []
+        self._file = ""
+
+        for _dir in Filter._dirs:
+            self._file = os.path.join(_dir + _file)
+            if os.path.exists(self._file):
+                break
+
+        try:
+            with open(self._file) as f:
+                for line in f.read().splitlines():
+                    if line:
+                        pattern, replacement = line.split("\t", 1)
+                        self.add(pattern, replacement)
+
+        except (IOError, ValueError) as e:
+            print("Could not read Rules file", self._file, e)
+            sys.exit(16)
+
+        # Strings without any of the literals are left as they are, unless a
+        # rule has no literal
+        self.screen = None
+        if self.rules and all(literal for literal, *rest in self.rules):
+            self.screen = re.compile(
+                "|".join(re.escape(literal) for literal, *rest in self.rules)
             )
 
+        logger.info("Rules File: " + str(self._file))
+        logger.info(f"Rewriting with {len(self.rules)} rules")
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def load(_file):
+        """Returns the compiled rules of a file, which are shared"""
+        return RuleTable(_file)
+
+    @staticmethod
+    def prefix(parsed):
+        """Returns the literal a parsed regular expression starts with"""
+
+        chars = []
+        for op, av in parsed:
+            if str(op) != "LITERAL":
+                break
+            chars.append(chr(av))
+
+        return "".join(chars)
+
+    def add(self, pattern, replacement):
+        """Compiles a rule"""
+
+        regex = re.compile(pattern)
+        parsed = sre_parse.parse(pattern)
+        literal = self.prefix(parsed)
+
+        # The literal followed by .* and a replacement without escapes or
+        # group references
+        tail = (
+            len(parsed) == len(literal) + 1
+            and pattern.endswith(".*")
+            and str(parsed[-1][0]) == "MAX_REPEAT"
+            and "\\" not in replacement
+        )
+
+        self.rules.append((literal, tail, regex, replacement))
+
+    def rewrite(self, string):
+        """Applies each rule in turn"""
+
+        if self.screen is not None and not self.screen.search(string):
+            return string
+
+        for literal, tail, regex, replacement in self.rules:
+            if literal not in string:
+                continue
+
+            if tail and "\n" not in string:
+                string = string[: string.find(literal)] + replacement
+            else:
+                string = regex.sub(replacement, string)
+
         return string
@@ -0,0 +1,473 @@
+"""Compiled index of the fingerprints, logs of known events such as a
+reboot which --fingerprint replaces with the name of their file. Each
+fingerprint file is hashed once into the set of its scrubbed keys, and
+the sets of all fingerprints are pickled to one index file in
+~/.cache/petit3. The index is used as long as the fingerprint files and
+the hash stopwords are unchanged, so a run only reads the index. Like
+the column caches, it is only loaded when it belongs to the user.
+
+An inverted map from each key to the fingerprints holding it lets every
+fingerprint be scored in one pass over the keys of a hash.
+
+Fingerprints can also be matched by similarity, for logs of another
+version of a distribution whose messages drifted slightly. The words of
+each key are summarized by a MinHash signature, whose share of equal
+values estimates the Jaccard similarity of the words of two keys. Keys
+are found in sublinear time by locality sensitive hashing: signatures are
+cut into bands, and only keys sharing a whole band with a key of the log
+are compared with it. A fingerprint key then counts as much as the
+similarity of the most similar key of the log, so that the found share
+of a fingerprint is an estimate of its Jaccard containment.
+
+Fingerprints can be learned from several captures of an event, as the
+keys found in every capture, see learn. Learned fingerprints are saved
+as .fpl files, which hold the keys themselves instead of a log, so they
+are neither parsed nor scrubbed again and leave out the lines which only
+happened to be logged along with one of the captures.
+
+"""
+
+import hashlib
+import logging
+import os
+import random
+import re
+
+from .log_cache import CACHE_DIR, dump, load
+from .log_crunch import CrunchLog
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the layout of the index or the keys of fingerprints change
+VERSION = 2
+
+# A fingerprint is found when more than this share of its keys are found
+THRESHOLD_COEFFICIENT = 0.31
+
+# Hash functions in a MinHash signature and values in each band of it.
+# Keys sharing a band are likely to have a similarity above about
+# (1 / bands) ** (1 / rows), here 0.5
+PERMUTATIONS = 64
+BAND_ROWS = 4
+
+# Hash functions are (a * x + b) mod the prime, with a and b drawn from
+# a fixed seed so that saved signatures stay comparable
+PRIME = (1 << 61) - 1
+SEED = 1
+
+# Suffix of learned fingerprints, which hold keys instead of log lines
+LEARNED = ".fpl"
+
+# Header of a learned fingerprint, which is followed by its keys
+LEARNED_HEADER = "# petit3 learned fingerprint"
+
+
+def find_fingerprints(prefixes):
+    """Returns the first of the prefixes holding files and its files, the
+    smallest first. Returns an empty list of files if there are none"""
+
+    prefix = ""
+
+    for prefix in prefixes:
+        if os.path.exists(prefix) and len(os.listdir(prefix)) >= 1:
+
+            # Process in order from largest to smallest which prevents
+            # double labeling with similar fingerprints
+            files = [os.path.join(prefix, f) for f in os.listdir(prefix)]
+            files.sort(key=lambda x: os.path.getsize(x))
+
+            return prefix, files
+
+    return prefix, []
+
+
+def signature(paths):
+    """Returns what identifies the contents of files, to tell whether an
+    index built from them is still current"""
+
+    signatures = []
+    for path in paths:
+        status = os.stat(path)
+        signatures.append((path, status.st_size, status.st_mtime_ns))
+
+    return signatures
+
+
+class MinHash:
+    """Computes MinHash signatures of the set of words of keys"""
+
+    def __init__(self, permutations=PERMUTATIONS, seed=SEED):
+        draw = random.Random(seed)
+
+        self.permutations = [
+            (draw.randrange(1, PRIME), draw.randrange(PRIME))
+            for i in range(permutations)
+        ]
+
+        # Hash values of each word seen so far
+        self.words = {}
+
+    def __getstate__(self):
+        return self.permutations
+
+    def __setstate__(self, permutations):
+        self.permutations = permutations
+        self.words = {}
+
+    def word(self, word):
+        """Returns the values of all hash functions for a word"""
+
+        values = self.words.get(word)
+
+        if values is None:
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            x = int.from_bytes(digest, "little")
+            values = tuple((a * x + b) % PRIME for a, b in self.permutations)
+            self.words[word] = values
+
+        return values
+
+    @staticmethod
+    def words(key):
+        """Returns the set of words of a key"""
+        return set(key.split()) or {key}
+
+    def signature(self, words):
+        """Returns the smallest value of each hash function over a set of
+        words"""
+        return tuple(map(min, zip(*(self.word(word) for word in words))))
+
+    @staticmethod
+    def similarity(signature, other):
+        """Estimates the Jaccard similarity of the words of two keys"""
+        return sum(a == b for a, b in zip(signature, other)) / len(signature)
+
+
+class SimilarityIndex:
+    """Locality sensitive hashing index of the signatures of keys"""
+
+    def __init__(self, keys, rows=BAND_ROWS):
+        self.minhash = MinHash()
+        self.keys = list(keys)
+        self.rows = rows
+
+        self.vocabulary = set()
+        self.signatures = []
+        for key in self.keys:
+            words = MinHash.words(key)
+            self.vocabulary.update(words)
+            self.signatures.append(self.minhash.signature(words))
+
+        # Numbers of the keys whose signature has the same values in a band
+        self.buckets = {}
+        for number, signature in enumerate(self.signatures):
+            for band in self.bands(signature):
+                self.buckets.setdefault(band, []).append(number)
+
+    def bands(self, signature):
+        """Yields the number and the values of each band of a signature"""
+
+        for start in range(0, len(signature), self.rows):
+            yield start, signature[start : start + self.rows]
+
+    def search(self, key, similarity):
+        """Returns the indexed keys whose estimated similarity to key is at
+        least similarity, with their estimate"""
+
+        words = MinHash.words(key)
+
+        # The similarity to any indexed key is at most the share of the
+        # words which are in one of them
+        if len(words.intersection(self.vocabulary)) < similarity * len(words):
+            return []
+
+        signature = self.minhash.signature(words)
+
+        candidates = set()
+        for band in self.bands(signature):
+            candidates.update(self.buckets.get(band, ()))
+
+        found = []
+        for number in candidates:
+            estimate = MinHash.similarity(signature, self.signatures[number])
+            if estimate >= similarity:
+                found.append((self.keys[number], estimate))
+
+        return found
+
+
+class Fingerprint:
+    """Keys of the hash of a fingerprint file, and the line of the sample
+    which stands in for the fingerprint once it is found"""
+
+    __slots__ = ("name", "keys", "threshold", "Entry", "line")
+
+    def __init__(self, name, keys, Entry, line):
+        self.name = name
+        self.keys = tuple(keys)
+        self.threshold = len(self.keys) * THRESHOLD_COEFFICIENT
+        self.Entry = Entry
+        self.line = line
+
+    @classmethod
+    def from_hash(cls, name, x, keys=None):
+        """Returns the fingerprint of the keys of a hash, by default all
+        of them"""
+
+        keys = list(x.keys()) if keys is None else keys
+
+        # The sample of the last key is shown for the fingerprint
+        sample = x[keys[-1]][1].first
+
+        return cls(name, keys, type(sample), sample.line)
+
+    @classmethod
+    def load(cls, name, path):
+        """Reads a learned fingerprint, a header with the format and the
+        line of the sample, a blank line and one key per line"""
+
+        with open(path) as f:
+            if f.readline().rstrip("\n") != LEARNED_HEADER:
+                raise ValueError(f"{path} is not a learned fingerprint")
+
+            header = {}
+            for line in f:
+                line = line.rstrip("\n")
+                if not line:
+                    break
+
+                field, _, value = line.partition(": ")
+                header[field] = value
+
+            keys = [line.rstrip("\n") for line in f]
+
+        try:
+            Entry = CrunchLog.formats()[header["format"]]
+            sample = header["sample"]
+        except KeyError as e:
+            raise ValueError(f"{path} has no {e} in its header")
+
+        return cls(name, keys, Entry, sample)
+
+    def save(self, path, captures):
+        """Writes a learned fingerprint, see load"""
+
+        with open(path, "w") as f:
+            print(LEARNED_HEADER, file=f)
+            print(f"captures: {captures}", file=f)
+            print(f"format: {self.Entry.format}", file=f)
+            print(f"sample: {self.line.rstrip()}", file=f)
+            print(file=f)
+
+            for key in self.keys:
+                print(key, file=f)
+
+    def sample(self):
+        """Returns an entry which shows the name of the fingerprint"""
+
+        sample = self.Entry(self.line)
+        sample.log_entry = self.name
+
+        return sample
+
+
+def learn(name, hashes):
+    """Returns the fingerprint of the keys found in every one of hashes,
+    the hashes of captures of the same event, or None if they share none.
+    Keys are in the order of the first capture"""
+
+    first = hashes[0]
+    keys = [key for key in first if all(key in x for x in hashes[1:])]
+
+    if not keys:
+        return None
+
+    return Fingerprint.from_hash(name, first, keys)
+
+
+class FingerprintIndex:
+    """Fingerprints in the order they are tried, and a map from each key
+    to the numbers of the fingerprints which hold it"""
+
+    def __init__(self, fingerprints):
+        self.fingerprints = fingerprints
+        self.inverted = {}
+
+        for number, fingerprint in enumerate(fingerprints):
+            for key in fingerprint.keys:
+                self.inverted.setdefault(key, []).append(number)
+
+        self.similar = SimilarityIndex(self.inverted)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    @classmethod
+    def compile(cls, prefix, files, build):
+        """Hashes the fingerprint files with build, which returns the
+        SuperHash of a file"""
+
+        fingerprints = []
+
+        for path in files:
+            # Ensure its a fingerprint file by checking the file prefix
+            if not re.search(r"\.fp", path):
+                continue
+
+            # Remove the prefix & set name
+            name = re.sub(prefix + "/", "", path)
+
+            if path.endswith(LEARNED):
+                try:
+                    fingerprint = Fingerprint.load(name, path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping fingerprint {path}: {e}")
+                    continue
+
+                if fingerprint.keys:
+                    fingerprints.append(fingerprint)
+                continue
+
+            x = build(path)
+            if len(x):
+                fingerprints.append(Fingerprint.from_hash(name, x))
+
+        return cls(fingerprints)
+
+    @classmethod
+    def load(cls, prefix, files, build, filter_file, cache_dir=CACHE_DIR):
+        """Returns the index of the fingerprint files, which is compiled
+        again and saved when they or the filter file changed"""
+
+        status = os.stat(prefix)
+        index_file = os.path.join(cache_dir, f"{status.st_dev}-{status.st_ino}.fpindex")
+
+        current = {
+            "version": VERSION,
+            "files": signature(files),
+            "filter": signature([filter_file]) if os.path.exists(filter_file) else None,
+        }
+
+        try:
+            state = load(index_file)
+        except FileNotFoundError:
+            state = None
+        except PermissionError as e:
+            logger.warning(f"Ignoring fingerprint index {index_file}: {e}")
+            state = None
+        except Exception as e:
+            logger.info(f"Ignoring fingerprint index {index_file}: {e}")
+            state = None
+
+        if state and all(state.get(name) == value for name, value in current.items()):
+            logger.info(f"Fingerprint index: {index_file}")
+            return state["index"]
+
+        logger.info(f"Compiling {len(files)} fingerprints to {index_file}")
+        index = cls.compile(prefix, files, build)
+
+        try:
+            dump(dict(current, index=index), index_file)
+        except OSError as e:
+            logger.warning(f"Cannot write fingerprint index {index_file}: {e}")
+
+        return index
+
+    def scores(self, keys):
+        """Returns the number of keys each fingerprint shares with keys, a
+        set like the keys of a hash, in one pass over the smaller side"""
+
+        scores = [0] * len(self.fingerprints)
+
+        if len(keys) < len(self.inverted):
+            shared = (key for key in keys if key in self.inverted)
+        else:
+            shared = (key for key in self.inverted if key in keys)
+
+        for key in shared:
+            for number in self.inverted[key]:
+                scores[number] += 1
+
+        return scores
+
+    def found(self, keys):
+        """Yields each fingerprint found among keys, the keys of a hash,
+        and the keys it removes. The caller removes them and adds the name
+        of the fingerprint before the next fingerprints are tried"""
+
+        # Count the keys of every fingerprint in one pass
+        scores = self.scores(keys)
+
+        for number, fingerprint in enumerate(self.fingerprints):
+
+            logger.info("Testing Fingerprint:" + fingerprint.name)
+            logger.info("Threshold:" + str(fingerprint.threshold))
+            logger.info("Count: " + str(scores[number]))
+
+            if scores[number] <= fingerprint.threshold:
+                continue
+
+            logger.info("Found Fingerprint:" + fingerprint.name)
+
+            removed = [key for key in fingerprint.keys if key in keys]
+            for key in removed:
+                for other in self.inverted[key]:
+                    scores[other] -= 1
+
+            # Later fingerprints may hold the name as a key
+            added = fingerprint.name not in keys
+
+            yield fingerprint, removed
+
+            if added:
+                for other in self.inverted.get(fingerprint.name, ()):
+                    scores[other] += 1
+
+    def matches(self, keys, similarity):
+        """Returns for each fingerprint a map from its keys to the keys of
+        keys which match them and their estimated similarity"""
+
+        matches = [{} for fingerprint in self.fingerprints]
+
+        for key in keys:
+            found = self.similar.search(key, similarity)
+
+            # Equal keys may have other words, e.g. repeated ones
+            if key in self.inverted:
+                found.append((key, 1.0))
+
+            for fingerprint_key, estimate in found:
+                for number in self.inverted[fingerprint_key]:
+                    matched = matches[number].setdefault(fingerprint_key, {})
+                    matched[key] = max(estimate, matched.get(key, 0.0))
+
+        return matches
+
+    def found_similar(self, keys, similarity):
+        """Like found, but fingerprint keys count as much as the most
+        similar of the keys whose similarity is at least similarity"""
+
+        matches = self.matches(keys, similarity)
+
+        for number, fingerprint in enumerate(self.fingerprints):
+            score = sum(
+                max(matched.values()) for matched in matches[number].values() if matched
+            )
+
+            logger.info("Testing Fingerprint:" + fingerprint.name)
+            logger.info(f"Similarity: {score / len(fingerprint.keys):.2f}")
+
+            if score <= fingerprint.threshold:
+                continue
+
+            logger.info("Found Fingerprint:" + fingerprint.name)
+
+            removed = {key for matched in matches[number].values() for key in matched}
+
+            # Removed keys no longer match later fingerprints
+            for later in matches[number + 1 :]:
+                for matched in later.values():
+                    for key in removed.intersection(matched):
+                        del matched[key]
+
+            yield fingerprint, removed
@@ -0,0 +1,97 @@
+"""Follows a growing log file like tail -F. The lines appended to the file
+are read from where the last read stopped, a line still being written is
+kept until it is complete, and a rotated or truncated file is read again
+from the start.
+
+"""
+
+import io
+import locale
+import logging
+import os
+import time
+
+from .log_input import compression, line_end
+
+logger = logging.getLogger(__name__)
+
+
+class LogFollower:
+    """Reads the lines appended to a plain log file"""
+
+    def __init__(self, path):
+        if path == "<stdin>" or compression(path) is not None:
+            raise ValueError(f"Cannot follow {path}, not a plain file")
+
+        self.path = path
+        self.encoding = locale.getpreferredencoding(False)
+        self.open()
+
+        # Lines before the offset are read as a log, following starts there
+        self.offset = line_end(path, os.fstat(self.file.fileno()).st_size)
+        self.file.seek(self.offset)
+
+    def open(self):
+        self.file = open(self.path, "rb")
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.partial = b""
+
+    def wait(self, interval):
+        """Waits until an empty file has a complete line"""
+
+        while not self.offset:
+            time.sleep(interval)
+            self.offset = line_end(self.path, os.fstat(self.file.fileno()).st_size)
+
+        self.file.seek(self.offset)
+
+    def read(self):
+        """Returns the complete lines appended since the last read"""
+
+        lines = self.read_lines()
+
+        try:
+            status = os.stat(self.path)
+        except FileNotFoundError:
+            # Rotated, the new file is not there yet
+            return lines
+
+        if status.st_ino != self.inode:
+            # The rest of the old file was read above
+            logger.info(f"{self.path} was rotated, following the new file")
+            self.file.close()
+            self.open()
+            lines += self.read_lines()
+
+        elif status.st_size < self.file.tell():
+            logger.info(f"{self.path} was truncated, following it from the start")
+            self.file.seek(0)
+            self.partial = b""
+            lines += self.read_lines()
+
+        return lines
+
+    def read_lines(self):
+        data = self.partial + self.file.read()
+
+        end = data.rfind(b"\n") + 1
+        self.partial = data[end:]
+
+        return [line.decode(self.encoding) for line in io.BytesIO(data[:end])]
+
+    def entries(self, Entry, matcher=None):
+        """Yields an entry for each appended line kept by matcher, lines
+        which cannot be parsed are skipped rather than stopping a live view"""
+
+        lines = self.read()
+        if matcher is not None:
+            lines = matcher.select(lines)
+
+        for line in lines:
+            try:
+                yield Entry(line)
+            except (ValueError, TypeError):
+                logger.warning(f"Cannot parse values on line: {line.rstrip()}")
+
+    def close(self):
+        self.file.close()
@@ -1,27 +1,75 @@
+"""Graphs of the number of log entries per second, minute, hour, day,
+month or year. Entry timestamps are converted to integer buckets of epoch
+seconds once and counted with a single histogram, which uses numpy when
+it is installed. The graph subtypes only configure the buckets and keys.
+
+"""
+
 import datetime
 import logging
 import sys
-from collections import UserDict
+from array import array
+from collections import Counter, UserDict
+from itertools import repeat
 from math import ceil
+from operator import floordiv
+
+from .log_columns import EPOCH, to_epoch
+from .log_crunch import CrunchLog
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 logger = logging.getLogger()
 
 
+def log_epochs(log):
+    """Returns the timestamps of a log as an array of epoch seconds. The
+    stamp column of a columnar CrunchLog is used as it is"""
+
+    if isinstance(log, CrunchLog) and log.columnar and "stamp" in log.column_names:
+        return log.columns.epochs()
+
+    return array("q", (to_epoch(entry.stamp) for entry in log))
+
+
+def histogram(epochs, width, low, high):
+    """Counts an array of epoch seconds in buckets of width seconds and
+    returns the counts of the buckets low to high"""
+
+    if numpy is not None:
+        buckets = numpy.frombuffer(epochs, dtype=numpy.int64) // width
+        buckets = buckets[(buckets >= low) & (buckets <= high)] - low
+        return numpy.bincount(buckets, minlength=high - low + 1).tolist()
+
+    if width == 1:
+        counts = Counter(epochs)
+    else:
+        counts = Counter(map(floordiv, epochs, repeat(width)))
+
+    return [counts.get(bucket, 0) for bucket in range(low, high + 1)]
+
+
 class GraphHash(UserDict):
-    """Interface class used to control structure & use of all GraphHash subtypes"""
+    """Interface class used to control structure & use of all GraphHash subtypes
 
-    def __init__(self, log, duration, unit, end="now"):
-        # Call parent init
-        UserDict.__init__(self)
+    Subtypes set the unit and duration of the graph, the width in seconds
+    of the buckets entries are counted in and how the keys are made.
+    """
 
-        # Turn first line into syslog
-        if len(log) > 0:
-            self.first_entry = log[-1]
-        else:
-            sys.exit()
+    unit = "seconds"
+    duration = 60
+    width = 1
 
-        self.unit = unit
-        self.duration = duration
+    # Buckets counted on both sides of the date range, for keys which span
+    # more than one bucket, e.g. a month of days
+    margin = 0
+
+    def __init__(self, log, end="now"):
+        # Call parent init
+        UserDict.__init__(self)
 
         self.max_value = 0
         self.min_value = 0
@@ -29,35 +77,77 @@ class GraphHash(UserDict):
         self.tick = "#"
         self.wide = False
 
+        self.end = end
+        self.epochs = array("q")
         self.start_date, self.middle_date = None, None
 
-        if end == "last":
-            self.end_date = datetime.datetime(
-                int(self.first_entry.year),
-                int(self.first_entry.month),
-                int(self.first_entry.day),
-                int(self.first_entry.hour),
-                int(self.first_entry.minute),
-                int(self.first_entry.second),
-            )
+        if log is not None:
+            self.fill(log)
+
+    def fill(self, log):
+        """Counts every entry of a log and builds the graph"""
+
+        # Convert the timestamps once, the log can be a streaming CrunchLog
+        self.epochs = log_epochs(log)
+        self.build_graph()
+
+    def add(self, entry):
+        """Adds the timestamp of one entry, build_graph counts them"""
+        self.epochs.append(to_epoch(entry.stamp))
+
+    def build_graph(self):
+        """Builds the date range and counts of the graph"""
+
+        if not len(self.epochs):
+            sys.exit()
+
+        self.count_graph()
+
+    def count_graph(self):
+        """Counts the timestamps in the date range ending now or at the
+        last entry"""
+
+        if self.end == "last":
+            self.end_date = EPOCH + datetime.timedelta(seconds=self.epochs[-1])
         else:
             self.end_date = datetime.datetime.now()
-        #
-        # Create a dictionary with an entry for each line.
-        self.log = log
+
+        self.build_date_range()
+        self.build_calculations(self.epochs)
+
+    def refresh(self):
+        """Builds the graph again with the entries added since, e.g. when
+        following a log, and drops the timestamps which fell out of it.
+        Returns False while there is nothing to graph"""
+
+        self.clear()
+        self.max_value, self.min_value = 0, 0
+
+        # The graph of now can be empty, the graph of the last entry cannot
+        if not len(self.epochs) and self.end == "last":
+            return False
+
+        self.count_graph()
+
+        low = (self.bucket(self.start_date) - self.margin) * self.width
+        self.epochs = array("q", (epoch for epoch in self.epochs if epoch >= low))
+
+        return True
 
     def build_date_range(self):
 
         self.end_key = self.create_key(self.end_date)
         logger.info(f"End key {self.end_key}")
 
-        self.duration = self.duration
-
         # Save final values
         self.start_date, self.middle_date = self.calc_dates(
             self.end_date, self.unit, self.duration
         )
 
+    def bucket(self, date):
+        """Returns the bucket a date is counted in"""
+        return to_epoch(date.timetuple()[:6]) // self.width
+
     def create_key(self, entry):
         return (
             f"{entry.year}{entry.month:02d}{entry.day:02d}"
@@ -85,15 +175,22 @@ class GraphHash(UserDict):
         if key not in self:
             self[key] = 0
 
-    def build_calculations(self):
+    def build_calculations(self, epochs):
         """Calculates and saves important graph information"""
 
-        for entry in self.log:
-            # Create key rooted in time
-            key = self.create_key(entry)
-            logger.debug(f"Incrementing {key}")
-            if key in self.keys():
-                self.increment(key)
+        low = self.bucket(self.start_date) - self.margin
+        high = self.bucket(self.end_date) + self.margin
+        counts = histogram(epochs, self.width, low, high)
+
+        # Only keys inside the zeroed date range are graphed, each bucket
+        # with entries is turned into a key once
+        for bucket, count in enumerate(counts, low):
+            if count:
+                date = EPOCH + datetime.timedelta(seconds=bucket * self.width)
+                key = self.create_key(date)
+                if key in self:
+                    logger.debug(f"Incrementing {key}")
+                    self[key] += count
 
         # find max value of any key
         for key in list(self.keys()):
@@ -269,13 +366,9 @@ class GraphHash(UserDict):
 class SecondsGraph(GraphHash):
     """60 second graph subtype"""
 
-    def __init__(self, log, end="now"):
-
-        # Call parent init
-        super().__init__(log, 60, "seconds", end=end)
-
-        self.build_date_range()
-        self.build_calculations()
+    unit = "seconds"
+    duration = 60
+    width = 1
 
     def create_key(self, entry):
         return (
@@ -291,16 +384,9 @@ class SecondsGraph(GraphHash):
 class MinutesGraph(GraphHash):
     """60 minute graph subtype"""
 
-    def __init__(self, log, end="now"):
-        # Call parent init
-        super().__init__(log, 60, "minutes")
-
-        self.end_date.replace(second=0)
-
-        self.build_date_range()
-        print(self.start_date)
-        print(self.end_date)
-        self.build_calculations()
+    unit = "minutes"
+    duration = 60
+    width = 60
 
     def create_key(self, entry):
         return (
@@ -318,13 +404,9 @@ class MinutesGraph(GraphHash):
 class HoursGraph(GraphHash):
     """24 hour graph subtype"""
 
-    def __init__(self, log, end="now"):
-        # Call parent init
-        super().__init__(log, 24, "hours", end=end)
-        self.end_date.replace(second=0, minute=0)
-
-        self.build_date_range()
-        self.build_calculations()
+    unit = "hours"
+    duration = 24
+    width = 3600
 
     def create_key(self, entry):
         return (
@@ -341,13 +423,9 @@ class HoursGraph(GraphHash):
 class DaysGraph(GraphHash):
     """30 day graph subtype"""
 
-    def __init__(self, log, end="now"):
-        # Call parent init
-        super().__init__(log, 31, "days", end=end)
-        self.end_date.replace(second=0, minute=0, hour=0)
-
-        self.build_date_range()
-        self.build_calculations()
+    unit = "days"
+    duration = 31
+    width = 86400
 
     def create_key(self, entry):
         return str(entry.year) + str("%.2d" % (entry.month)) + str("%.2d" % (entry.day))
@@ -359,13 +437,10 @@ class DaysGraph(GraphHash):
 class MonthsGraph(GraphHash):
     """12 month graph subtype"""
 
-    def __init__(self, log, end="now"):
-        # Call parent init
-        super().__init__(log, 12, "months", end=end)
-        self.end_date.replace(second=0, minute=0, hour=0, day=1)
-
-        self.build_date_range()
-        self.build_calculations()
+    unit = "months"
+    duration = 12
+    width = 86400
+    margin = 31
 
     def create_key(self, entry):
         return str(entry.year) + str("%.2d" % (entry.month))
@@ -377,13 +452,9 @@ class MonthsGraph(GraphHash):
 class YearsGraph(GraphHash):
     """10 year graph subtype"""
 
-    def __init__(self, log, end="now"):
-        # Call parent init
-        super().__init__(log, 10, "years", end=end)
-        self.end_date.replace(second=0, minute=0, hour=0, day=1, month=1)
-
-        self.build_date_range()
-        self.build_calculations()
+    unit = "years"
+    duration = 10
+    width = 86400
 
     def create_key(self, entry):
         return str(entry.year) + str("%.2d" % (entry.month)) + str("%.2d" % (entry.day))
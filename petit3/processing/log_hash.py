@@ -5,8 +5,9 @@ import os
 import re
 import sys
 from collections import UserDict
-from random import choice
+from random import choice, random, randrange
 
+from .log_columns import Row, to_epoch
 from .log_crunch import CrunchLog
 from .log_entries import (
     ApacheAccessEntry,
@@ -17,7 +18,10 @@ from .log_entries import (
     SnortEntry,
     SyslogEntry,
 )
-from .log_filter import Filter
+from .log_filter import Filter, RuleTable
+from .log_fingerprint import FingerprintIndex, find_fingerprints
+from .log_input import LineRef
+from .log_parallel import parallel_fill
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +33,112 @@ STOPWORDS_HOST = "host.stopwords"
 STOPWORDS_DAEMON = "daemon.stopwords"
 STOPWORDS_WORDS = "words.stopwords"
 
+RULES_SECURE = "secure.rules"
+
+
+class Samples:
+    """Bounded store for the sample entries of one SuperHash key. Keeps
+    the first entry seen, for threshold sampling, and a uniform reservoir
+    of up to size entries, for sampling all keys. Entries of a mapped log
+    are kept as references to their line and parsed again when used."""
+
+    size = 8
+
+    def __init__(self):
+        self.seen = 0
+        self._first = None
+        self.reservoir = []
+
+    def __len__(self):
+        return len(self.reservoir)
+
+    def __iter__(self):
+        return (self.resolve(sample) for sample in self.reservoir)
+
+    @property
+    def first(self):
+        return self.resolve(self._first)
+
+    @staticmethod
+    def keep(entry):
+        """Returns what is stored for an entry"""
+
+        if getattr(entry, "source", None) is not None:
+            return LineRef(entry)
+        return entry
+
+    @staticmethod
+    def resolve(sample):
+        """Returns the entry for what was stored"""
+
+        if isinstance(sample, LineRef):
+            return sample.resolve()
+        return sample
+
+    def append(self, entry, weight=1):
+        """Offers an entry to the reservoir. An entry standing in for
+        weight entries is kept with a correspondingly higher probability"""
+
+        self.seen += weight
+
+        if self._first is None:
+            self._first = self.keep(entry)
+
+        if len(self.reservoir) < self.size:
+            self.reservoir.append(self.keep(entry))
+
+        # Keep each of the seen entries with equal probability
+        elif random() * self.seen < self.size * weight:
+            self.reservoir[randrange(self.size)] = self.keep(entry)
+
+    def merge(self, other):
+        """Combines the samples of other, which were taken after ours"""
+
+        if self._first is None:
+            self._first = other._first
+
+        ours, theirs = list(self.reservoir), list(other.reservoir)
+        ours_left, theirs_left = self.seen, other.seen
+        self.reservoir = []
+
+        # Draw from each side in proportion to the entries it has seen
+        while len(self.reservoir) < self.size and (ours or theirs):
+            if theirs and (
+                not ours or random() * (ours_left + theirs_left) >= ours_left
+            ):
+                self.reservoir.append(theirs.pop(randrange(len(theirs))))
+                theirs_left -= 1
+            else:
+                self.reservoir.append(ours.pop(randrange(len(ours))))
+                ours_left -= 1
+
+        self.seen += other.seen
+
+    def choice(self):
+        """Returns a random sample"""
+        return self.resolve(choice(self.reservoir))
+
+    def dump(self):
+        """Returns the number of seen entries and the lines of the samples,
+        which can be saved as JSON"""
+
+        return {
+            "seen": self.seen,
+            "first": self.first.line,
+            "reservoir": [entry.line for entry in self],
+        }
+
+    @classmethod
+    def load(cls, state, Entry):
+        """Returns the samples saved by dump, parsing the lines as Entry"""
+
+        samples = cls()
+        samples.seen = state["seen"]
+        samples._first = Entry(state["first"])
+        samples.reservoir = [Entry(line) for line in state["reservoir"]]
+
+        return samples
+
 
 class SuperHash(UserDict):
     """Interface and parent class for all hash/dict based objects."""
@@ -36,40 +146,90 @@ class SuperHash(UserDict):
     _filter = Filter()
     sample = "none"
 
-    def __init__(self, log, filter_filename=None):
+    # TimeWindow of a hash which only counts the entries of the last
+    # minutes, None for a hash of all entries
+    window = None
+
+    def __init__(self, log, filter_filename=None, window=None):
 
         # Call parent init
         UserDict.__init__(self)
 
-        if log[0] and filter_filename:
-            # Setup log and filter
+        if filter_filename:
+            # Setup filter
             self._filter = Filter(filter_filename)
-            self.fill(log)
 
-        elif log[0]:
-            # Setup log without filter
-            self.fill(log)
+        if window is not None:
+            self.window = window
 
-        else:
-            # Create empty filter
-            pass
+        if log is not None:
+            # Entries are consumed one at a time, so the log may be a
+            # streaming CrunchLog which is never held in memory
+            self.fill(log)
 
     def fill(self, log):
+        """Adds every entry of a log and removes meaningless entries"""
+
+        for entry in log:
+            self.add(entry)
+
+        self.cleanup()
+        self._filter.report()
+
+    def add(self, entry):
         """Interface method which is flled in by subclasses"""
         pass
 
-    def increment(self, key, entry):
+    def increment(self, key, entry, count=1):
         """Adds a new entry to superhash data structures.
         Similar to append for a list"""
 
+        # Entries from before the window are not counted
+        if self.window is not None:
+            if not self.window.admit(self, key, to_epoch(entry.stamp), entry, count):
+                return
+
         # Check to make sure it exists
         if key not in self:
-            self[key] = [0, []]
+            self[key] = [0, Samples()]
 
         # Increment the hashed count
-        # Create an array of un-hashed values for sampling later
-        self[key][0] += 1
-        self[key][1].append(entry)
+        # Keep a bounded set of un-hashed values for sampling later
+        self[key][0] += count
+        self[key][1].append(entry, count)
+
+    def slide(self, date):
+        """Expires the entries of a windowed hash which are no longer in
+        the window ending at date, e.g. now"""
+
+        if self.window is not None:
+            self.window.slide(self, to_epoch(date.timetuple()[:6]))
+
+    def fill_dictionary(self, log, name):
+        """Fills the hash from the dictionary encoded host or daemon column
+        of a columnar log, scrubbing each distinct value only once"""
+
+        column = log.columns.dictionary(name)
+        rows = log.columns.rows
+
+        for value, count, first_row in column.summary(rows):
+            key = self._filter.scrub(value)
+            self.increment(key, Row(log.columns, first_row), count)
+
+        self.cleanup()
+        self._filter.report()
+
+    def merge(self, other):
+        """Adds the counts and samples of another hash of the same type.
+        Samples of other are appended, so merging in input order keeps
+        the first seen sample of every key"""
+
+        for key, (count, samples) in other.items():
+            if key not in self:
+                self[key] = [0, Samples()]
+
+            self[key][0] += count
+            self[key][1].merge(samples)
 
     def display(self):
         """Displays all entries held in the SuperHash structure"""
@@ -86,7 +246,7 @@ class SuperHash(UserDict):
 
             # Print all lines as sample
             if self.sample == "all":
-                self.print_entry(self[key][0], choice(self[key][1]).log_entry)
+                self.print_entry(self[key][0], self[key][1].choice().log_entry)
 
             elif self.sample == "none":
                 self.print_entry(self[key][0], str(key))
@@ -94,41 +254,31 @@ class SuperHash(UserDict):
             elif self.sample == "threshold":
                 # Print sample for small values below/equal to threshold
                 if self[key][0] <= sample_threshold:
-                    self.print_entry(self[key][0], self[key][1][0].log_entry)
+                    self.print_entry(self[key][0], self[key][1].first.log_entry)
                 else:
                     self.print_entry(self[key][0], str(key))
             else:
                 print(f"That type of sampling is not supported: {self.sample}")
                 sys.exit(16)
 
-    def fingerprint(self):
+    def fingerprint(self, similarity=None):
         """
         Remove all fingerprints from a given LogHash and replace with a
         single string"
-        """
 
-        # Declarations & Variables
-        threshold_coefficient = 0.31
-        fingerprints = []
-        fingerprint_files = []
+        With similarity, a Jaccard similarity between 0 and 1, the keys
+        of a fingerprint also match keys which are that similar to them,
+        e.g. the same message of another version of a daemon.
+        """
 
         # Load & assign fingerprint files
         prefixes = [
             os.path.join(PRECEEDING_DIR, FINGERPRINTS),  # takes precedence
             f"{os.path.join(os.path.dirname(os.path.dirname(__file__)), FINGERPRINTS)}",
         ]
-        prefix = ""
 
         # Search for fingerprints and load the first one encountered
-        for prefix in prefixes:
-            if os.path.exists(prefix) and len(os.listdir(prefix)) >= 1:
-
-                # Process in order from largest to smallest which prevents
-                # double labeling with similar fingerprints
-                fingerprint_files = os.listdir(prefix)
-                fingerprint_files = [os.path.join(prefix, f) for f in fingerprint_files]
-                fingerprint_files.sort(key=lambda x: os.path.getsize(x))
-                break
+        prefix, fingerprint_files = find_fingerprints(prefixes)
 
         if not len(fingerprint_files):
             print(
@@ -136,51 +286,34 @@ class SuperHash(UserDict):
             )
             sys.exit(1)
 
-        for fingerprint_file in fingerprint_files:
-            # Ensure its a fingerprint file by checking the file prefix
-            if re.search(r"\.fp", fingerprint_file):
-
-                # Build a Log for the fingerprint
-                log = CrunchLog(fingerprint_file)
-
-                # Build a SuperHash
-                x = SuperHash.manufacture(log, STOPWORDS_HASH)
-
-                # Remove the prefix & set name
-                x._filter._file = re.sub(prefix + "/", "", fingerprint_file)
-                fingerprints.append(x)
-
-        # Iterate each fingerprint
-        for fingerprint in fingerprints:
-
-            logger.info("Testing Fingerprint:" + fingerprint._filter._file)
-
-            # Reset counter for each fingerprint
-            count = 0
-            threshold = len(fingerprint) * threshold_coefficient
-            logger.info("Threshold:" + str(threshold))
+        index = FingerprintIndex.load(
+            prefix,
+            fingerprint_files,
+            lambda path: SuperHash.manufacture(CrunchLog(path), STOPWORDS_HASH),
+            Filter(STOPWORDS_HASH)._file,
+        )
+
+        # Iterate each fingerprint, a fingerprint which is found removes
+        # its keys before the next ones are tried
+        if similarity is None:
+            found = index.found(self)
+        else:
+            found = index.found_similar(self, similarity)
 
-            # Look for fingerpring
-            for key in list(fingerprint.keys()):
+        for fingerprint, keys in found:
+            # If Threshold is reached, remove everyline of fingerprint
+            for key in keys:
+                # Key found, plenty to remove
                 if key in self:
-                    count = count + 1
-
-                # If Threshold is reached, remove everyline of fingerprint
-                # Saves time on searching every entry
-                if count > threshold:
-                    logger.info("Found Fingerprint:" + fingerprint._filter._file)
-                    for key in list(fingerprint.keys()):
-                        # Key found, plenty to remove
-                        if key in self:
-                            del self[key]
+                    del self[key]
 
-                    # Force the sample entry to be the same as the key
-                    # and based off of the filename of the fingerprint
-                    fingerprint[key][1][0].log_entry = fingerprint._filter._file
-                    self.increment(fingerprint._filter._file, fingerprint[key][1][0])
-                    break
-
-            logger.info("Count: " + str(count))
+            # Force the sample entry to be the same as the key
+            # and based off of the filename of the fingerprint.
+            # The fingerprint is counted even though its sample is
+            # older than the window
+            window, self.window = self.window, None
+            self.increment(fingerprint.name, fingerprint.sample())
+            self.window = window
 
     def cleanup(self):
         """Removes meaningless entries
@@ -199,10 +332,32 @@ class SuperHash(UserDict):
         cnt = str(cnt) + ":"
         print(f"{cnt:<8}{entry}")
 
+    @classmethod
+    def build(cls, log, filter_filename=None, jobs=1, window=None):
+        """Builds a hash of this type, sharding the input over a pool of
+        jobs processes when the log is a plain file. Cached logs are
+        read from their cache instead, and windowed hashes need the
+        entries in order"""
+
+        if jobs > 1 and log.splittable and log.cache is None and window is None:
+            return parallel_fill(cls, log, filter_filename, jobs)
+
+        if jobs > 1:
+            logger.info(f"Cannot split {log.file_name}, hashing on one core")
+
+        return cls(log, filter_filename, window)
+
     @staticmethod
-    def manufacture(log, _filter):
+    def manufacture(log, _filter, jobs=1, window=None):
         """Factory method which creates new SuperHash of correct subtype"""
 
+        # Build and return the correct subclass instance based on log file type
+        return SuperHash.select(log).build(log, _filter, jobs, window)
+
+    @staticmethod
+    def select(log):
+        """Returns the SuperHash subtype for the entries of a log"""
+
         # Select the correct build method
         if log.contains(SyslogEntry):
             LogHash = SyslogHash
@@ -224,176 +379,86 @@ class SuperHash(UserDict):
             )
             sys.exit(15)
 
-        # Build and return the correct subclass instance based on log file type
-        return LogHash(log, _filter)
+        return LogHash
 
 
 class SyslogHash(SuperHash):
-    """Overrides the fill method specifically for LogHashes built from Syslog files"""
+    """Overrides the add method specifically for LogHashes built from Syslog files"""
 
-    def fill(self, log):
+    def add(self, entry):
         # Create a dictionary with an entry for each line. Increment
         # the value for each time the word is found. Merge lines by
         # Removing numbers and replacing them with a single '#'
-        for entry in log:
 
-            # Scrub sections of SyslogEntry which will be used to key the hash
-            key = self._filter.scrub(entry.daemon + " " + entry.log_entry)
+        # Scrub sections of SyslogEntry which will be used to key the hash
+        key = self._filter.scrub(entry.daemon + " " + entry.log_entry)
 
-            # increment the LogHash with the new key
-            self.increment(key, entry)
-
-        self.cleanup()
+        # increment the LogHash with the new key
+        self.increment(key, entry)
 
 
 class ApacheLogHash(SuperHash):
-    """Overrides the fill method specifically for LogHashes built from Apache logs"""
+    """Overrides the add method specifically for LogHashes built from Apache logs"""
 
-    def fill(self, log):
+    def add(self, entry):
         # Create a dictionary with an entry for each line. Increment
         # the value for each time the word is found. Merge lines by
         # Removing numbers and replacing them with a single '#'
-        for entry in log:
 
-            # Scrub sections of SyslogEntry which will be used to key the hash
-            key = self._filter.scrub(entry.log_entry)
+        # Scrub sections of SyslogEntry which will be used to key the hash
+        key = self._filter.scrub(entry.log_entry)
 
-            # increment the LogHash with the new key
-            self.increment(key, entry)
-
-        self.cleanup()
+        # increment the LogHash with the new key
+        self.increment(key, entry)
 
 
 class SnortLogHash(SuperHash):
-    """Overrides the fill method specifically for LogHashes built from Snort logs"""
+    """Overrides the add method specifically for LogHashes built from Snort logs"""
 
-    def fill(self, log):
+    def add(self, entry):
         # Create a dictionary with an entry for each line. Increment
         # the value for each time the word is found. Merge lines by
         # Removing numbers and replacing them with a single '#'
-        for entry in log:
 
-            # Scrub sections of SyslogEntry which will be used to key the hash
-            key = self._filter.scrub(entry.log_entry)
+        # Scrub sections of SyslogEntry which will be used to key the hash
+        key = self._filter.scrub(entry.log_entry)
 
-            # increment the LogHash with the new key
-            self.increment(key, entry)
-
-        self.cleanup()
+        # increment the LogHash with the new key
+        self.increment(key, entry)
 
 
 class SecureLogHash(SuperHash):
-    """Overrides the fill method specifically for LogHashes built from Syslog files"""
+    """Overrides the add method specifically for LogHashes built from Syslog files"""
 
-    def fill(self, log):
+    def add(self, entry):
         # Create a dictionary with an entry for each line. Increment
         # the value for each time the word is found. Merge lines by
         # Removing numbers and replacing them with a single '#'
-        for entry in log:
-
-            # Clean up the log entry better since it is a secure log hash
-
-            ## Session Entries
-            entry.log_entry = re.sub(
-                "session closed for.*", "session closed for #", entry.log_entry
-            )
-            entry.log_entry = re.sub(
-                "session opened for.*", "session opened for #", entry.log_entry
-            )
-
-            ## Auth Entries
-            entry.log_entry = re.sub(
-                "Accepted publickey for.*",
-                "Accepted publickey for #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "Accepted password for.*",
-                "Accepted password for #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "Postponed publickey for.*",
-                "Postponed publickey for #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "input_userauth_request: invalid user.*",
-                "input_userauth_request: invalid user #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "Invalid user.*", "Invalid user #", entry.log_entry
-            )
-            entry.log_entry = re.sub(
-                "reverse mapping checking getaddrinfo for.*",
-                "reverse mapping checking getaddrinfo for #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "Connection closed by.*",
-                "Connection closed by #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "Failed password for invalid user.*",
-                "Failed password for invalid user #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "Failed password for.*from.*",
-                "Failed password for # from #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "error retrieving information about user.*",
-                "error retrieving information about user #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "authentication failure.*",
-                "authentication failure #",
-                entry.log_entry,
-            )
-
-            ## Misc
-            entry.log_entry = re.sub(
-                "Received disconnect from.*",
-                "Received disconnect from #",
-                entry.log_entry,
-            )
-            entry.log_entry = re.sub(
-                "Could not reverse map address.*",
-                "Could not reverse map address #",
-                entry.log_entry,
-            )
-            # entry.log_entry = re.sub("", "", entry.log_entry)
 
-            # Scrub sections of SyslogEntry which will be used to key the hash
-            key = self._filter.scrub(entry.daemon + " " + entry.log_entry)
+        # Clean up the log entry better since it is a secure log hash. The
+        # entry is left as it is, so that samples show the original line
+        log_entry = RuleTable.load(RULES_SECURE).rewrite(entry.log_entry)
 
-            # increment the LogHash with the new key
-            self.increment(key, entry)
+        # Scrub sections of SyslogEntry which will be used to key the hash
+        key = self._filter.scrub(entry.daemon + " " + log_entry)
 
-        self.cleanup()
+        # increment the LogHash with the new key
+        self.increment(key, entry)
 
 
 class RawLogHash(SuperHash):
-    """Overrides the fill method specifically for LogHashes built from text files without date/time"""
+    """Overrides the add method specifically for LogHashes built from text files without date/time"""
 
-    def fill(self, log):
+    def add(self, entry):
         # Create a dictionary with an entry for each line. Increment
         # the value for each time the word is found. Merge lines by
         # Removing numbers and replacing them with a single '#'
-        for entry in log:
 
-            # Scrub sections of SyslogEntry which will be used to key the hash
-            key = self._filter.scrub(entry.log_entry)
+        # Scrub sections of SyslogEntry which will be used to key the hash
+        key = self._filter.scrub(entry.log_entry)
 
-            # increment the LogHash with the new key
-            self.increment(key, entry)
-
-        self.cleanup()
+        # increment the LogHash with the new key
+        self.increment(key, entry)
 
 
 class DaemonHash(SyslogHash):
@@ -404,15 +469,33 @@ class DaemonHash(SyslogHash):
         # Create a dictionary with an entry for each line. Increment
         # the value for each time the word is found. Merge lines by
         # Removing numbers and replacing them with a single '#'
-        for entry in log:
+        # Columnar logs only need one scrub per distinct daemon
+        if (
+            isinstance(log, CrunchLog)
+            and log.dictionary("daemon")
+            and self.window is None
+        ):
+            return self.fill_dictionary(log, "daemon")
 
-            # Scrub sections of SyslogEntry which will be used to key the hash
-            key = self._filter.scrub(entry.daemon)
+        super().fill(log)
 
-            # increment the LogHash with the new key
-            self.increment(key, entry)
+    def add(self, entry):
 
-        self.cleanup()
+        # Scrub sections of SyslogEntry which will be used to key the hash
+        key = self._filter.scrub(entry.daemon)
+
+        # increment the LogHash with the new key
+        self.increment(key, entry)
+
+    def cleanup(self):
+        """Removes meaningless entries, except the empty key which counts
+        the entries of logs without daemons"""
+
+        empty = self.pop("", None)
+        super().cleanup()
+
+        if empty is not None:
+            self[""] = empty
 
 
 class HostHash(SyslogHash):
@@ -423,15 +506,33 @@ class HostHash(SyslogHash):
         # Create a dictionary with an entry for each line. Increment
         # the value for each time the word is found. Merge lines by
         # Removing numbers and replacing them with a single '#'
-        for entry in log:
+        # Columnar logs only need one scrub per distinct host
+        if (
+            isinstance(log, CrunchLog)
+            and log.dictionary("host")
+            and self.window is None
+        ):
+            return self.fill_dictionary(log, "host")
 
-            # Scrub sections of SyslogEntry which will be used to key the hash
-            key = self._filter.scrub(entry.host)
+        super().fill(log)
 
-            # increment the LogHash with the new key
-            self.increment(key, entry)
+    def add(self, entry):
 
-        self.cleanup()
+        # Scrub sections of SyslogEntry which will be used to key the hash
+        key = self._filter.scrub(entry.host)
+
+        # increment the LogHash with the new key
+        self.increment(key, entry)
+
+    def cleanup(self):
+        """Removes meaningless entries, except the empty key which counts
+        the entries of logs without hosts"""
+
+        empty = self.pop("", None)
+        super().cleanup()
+
+        if empty is not None:
+            self[""] = empty
 
 
 class WordHash(SuperHash):
@@ -440,16 +541,17 @@ class WordHash(SuperHash):
     Date, time, and other common words are excluded from the count.
     """
 
-    def fill(self, log):
+    def add(self, entry):
 
         # Create a dictionary with an entry for each word. Increment
         # the value for each time the word is found
-        for entry in log:
+        # Base the wordcount on the log_entry payload
+        for word in entry.log_entry.split():
+            # increment the WordHash with the new key
+            self.increment(word, word)
 
-            # Base the wordcount on the log_entry payload
-            for word in entry.log_entry.split():
-                # increment the WordHash with the new key
-                self.increment(word, word)
+    def cleanup(self):
+        """Scrubs the counted words, then removes meaningless entries"""
 
         # Perform bleach at the end because it is more efficient
         for key in list(self.keys()):
@@ -464,7 +566,7 @@ class WordHash(SuperHash):
             if newkey in self:
                 # Correct way of adding up
                 self[newkey][0] += self[key][0]
-                self[newkey][1].append(self[key][1])
+                self[newkey][1].merge(self[key][1])
 
             else:
                 self[newkey] = self[key]
@@ -472,4 +574,4 @@ class WordHash(SuperHash):
             # Remove non-scrubbed entry
             del self[key]
 
-        self.cleanup()
+        SuperHash.cleanup(self)
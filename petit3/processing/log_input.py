@@ -0,0 +1,248 @@
+"""Reads compressed and memory mapped logs. Gzip, bzip2 and xz files are
+recognized by their magic bytes and decompressed by a background thread,
+which hands blocks to the reader through a bounded queue. The compression
+modules release the GIL, so decompression and parsing run on two cores.
+
+Plain files can be memory mapped instead of read, so that lines can be
+referred to by their offset and decoded again only when they are shown.
+
+"""
+
+import codecs
+import importlib
+import io
+import locale
+import mmap
+import os
+import queue
+import threading
+
+# Magic bytes at the start of compressed files and the module reading them
+COMPRESSION = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "lzma"),
+)
+
+# Size of the decompressed blocks and the number of blocks read ahead
+BLOCK_SIZE = 2**20
+READ_AHEAD = 8
+
+# Size of the blocks read backwards to find the end of the last line
+LINE_BLOCK_SIZE = 2**16
+
+# Encodings in which a line ends with the byte of a newline
+MAPPED_ENCODINGS = ("ascii", "utf-8", "latin-1", "cp1252")
+
+
+def compression(path):
+    """Returns the name of the module which decompresses a file, or None
+    for an uncompressed file"""
+
+    with open(path, "rb") as f:
+        head = f.read(6)
+
+    for magic, codec in COMPRESSION:
+        if head.startswith(magic):
+            return codec
+
+    return None
+
+
+def open_compressed(path, codec):
+    """Opens a compressed file as text, like open(path, "r")"""
+    return io.TextIOWrapper(io.BufferedReader(ReadAhead(path, codec), BLOCK_SIZE))
+
+
+class ReadAhead(io.RawIOBase):
+    """Binary stream of the decompressed contents of a file, which are
+    decompressed by a background thread ahead of the reader"""
+
+    def __init__(self, path, codec, blocks=READ_AHEAD):
+        super().__init__()
+
+        self.blocks = queue.Queue(maxsize=blocks)
+        self.stopped = threading.Event()
+        self.block = memoryview(b"")
+        self.eof = False
+
+        self.thread = threading.Thread(
+            target=self.decompress, args=(path, codec), daemon=True
+        )
+        self.thread.start()
+
+    def decompress(self, path, codec):
+        """Runs in the background thread, an empty block marks the end and
+        errors are handed over to be raised by the reader"""
+
+        try:
+            with importlib.import_module(codec).open(path, "rb") as f:
+                while not self.stopped.is_set():
+                    block = f.read(BLOCK_SIZE)
+                    self.blocks.put(block)
+
+                    if not block:
+                        return
+        except Exception as e:
+            self.blocks.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.block:
+            if self.eof:
+                return 0
+
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                raise block
+
+            if not block:
+                self.eof = True
+                return 0
+
+            self.block = memoryview(block)
+
+        n = min(len(b), len(self.block))
+        b[:n] = self.block[:n]
+        self.block = self.block[n:]
+
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+
+            # Make room in case the thread waits for a free slot
+            try:
+                while True:
+                    self.blocks.get_nowait()
+            except queue.Empty:
+                pass
+
+        super().close()
+
+
+def line_end(path, size):
+    """Returns the offset after the last complete line of the first size
+    bytes of a file, so that a line still being written is left for
+    later"""
+
+    with open(path, "rb") as f:
+        end = size
+
+        while end > 0:
+            start = max(0, end - LINE_BLOCK_SIZE)
+            f.seek(start)
+
+            i = f.read(end - start).rfind(b"\n")
+            if i >= 0:
+                return start + i + 1
+
+            end = start
+
+    return 0
+
+
+def spread_lines(path, count, span=None):
+    """Returns up to count lines starting after evenly spaced byte offsets
+    of a plain file, or of its (start, end) span, so that they sample the
+    whole file without reading it"""
+
+    encoding = locale.getpreferredencoding(False)
+    start, end = span or (0, os.path.getsize(path))
+    lines = []
+
+    with open(path, "rb") as f:
+        for i in range(count):
+            offset = start + (end - start) * (2 * i + 1) // (2 * count)
+            f.seek(offset)
+
+            # Skip the rest of the line the offset landed in
+            if offset > start:
+                f.readline()
+
+            if f.tell() >= end:
+                break
+
+            line = f.readline()
+            if not line:
+                break
+
+            lines.append(line.decode(encoding, "replace"))
+
+    return lines
+
+
+def map_file(path):
+    """Returns a MappedFile of a plain file, or None if the lines of the
+    mapping would differ from the lines read by open(path, "r")"""
+
+    if path == "<stdin>" or compression(path) is not None:
+        return None
+
+    encoding = locale.getpreferredencoding(False)
+    if codecs.lookup(encoding).name not in MAPPED_ENCODINGS:
+        return None
+
+    with open(path, "rb") as f:
+        # Empty files cannot be mapped
+        try:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+
+    # Reading text translates carriage returns into newlines
+    if mapping.find(b"\r") >= 0:
+        mapping.close()
+        return None
+
+    return MappedFile(path, mapping, encoding)
+
+
+class MappedFile:
+    """Read only memory map of a plain file, whose lines are referred to
+    by their offset and decoded when their text is needed"""
+
+    def __init__(self, path, mapping, encoding):
+        self.path = path
+        self.mapping = mapping
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def lines(self):
+        """Yields the offset and the text of each line. The lines are read
+        from the position of the mapping, so only one iteration at a time
+        should be in progress"""
+
+        self.mapping.seek(0)
+        offset = 0
+
+        for raw in iter(self.mapping.readline, b""):
+            yield offset, raw.decode(self.encoding)
+            offset += len(raw)
+
+    def line(self, offset):
+        """Returns the text of the line starting at offset"""
+
+        end = self.mapping.find(b"\n", offset) + 1 or len(self.mapping)
+        return str(self.mapping[offset:end], self.encoding)
+
+
+class LineRef:
+    """Reference to the line of an entry of a mapped log, which is parsed
+    again when the entry is needed"""
+
+    __slots__ = ("Entry", "mapped", "offset")
+
+    def __init__(self, entry):
+        self.Entry = type(entry)
+        self.mapped, self.offset = entry.source
+
+    def resolve(self):
+        entry = self.Entry(self.mapped.line(self.offset))
+        entry.source = (self.mapped, self.offset)
+        return entry
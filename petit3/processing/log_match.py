@@ -0,0 +1,115 @@
+"""Selects the raw lines of a log before they are parsed, like grep. Only
+the lines which match one of the --match patterns, if any, and none of
+the --exclude patterns are kept, so entries are only built and scrubbed
+for those lines.
+
+Patterns which are plain strings are looked for with the in operator,
+which is much faster than the regular expression engine, and the other
+patterns are compiled into one alternation which is searched once. The
+global flags a pattern starts with, e.g. (?i), are scoped to its own
+branch of the alternation.
+
+"""
+
+import re
+
+from .log_filter import ScrubEngine
+
+# Global flags at the start of a pattern, e.g. (?i) or (?s)(?m)
+GLOBAL_FLAGS_RE = re.compile(r"(?:\(\?[aiLmsux]+\))+")
+
+
+def scoped(pattern):
+    """Returns the pattern as a group, with the global flags it starts
+    with only applying to the group, so that it can be part of an
+    alternation"""
+
+    flags = GLOBAL_FLAGS_RE.match(pattern)
+    if flags is None:
+        return f"(?:{pattern})"
+
+    letters = "".join(re.findall(r"[aiLmsux]", flags.group()))
+
+    # A verbose pattern can end with a comment, which would hide the )
+    end = "\n)" if "x" in letters else ")"
+
+    return f"(?{letters}:{pattern[flags.end():]}{end}"
+
+
+def compile_search(patterns):
+    """Returns a function which tells whether a line matches one of the
+    patterns, regular expressions given as strings"""
+
+    literals, regexes = [], []
+    for pattern in patterns:
+        literal = ScrubEngine.literal(re.compile(pattern))
+        if literal is not None:
+            literals.append(literal)
+        else:
+            regexes.append(pattern)
+
+    literals = tuple(literals)
+    regex = None
+    if regexes:
+        regex = re.compile("|".join(scoped(pattern) for pattern in regexes))
+
+    if not regexes and len(literals) == 1:
+        literal = literals[0]
+        return lambda line: literal in line
+
+    if not literals:
+        return lambda line: regex.search(line) is not None
+
+    def search(line):
+        for literal in literals:
+            if literal in line:
+                return True
+
+        return regex is not None and regex.search(line) is not None
+
+    return search
+
+
+class LineMatcher:
+    """Keeps the lines which match one of match, unless it is empty, and
+    none of exclude, both lists of patterns"""
+
+    def __init__(self, match=None, exclude=None):
+        self.match = list(match or [])
+        self.exclude = list(exclude or [])
+
+        included = compile_search(self.match) if self.match else None
+        excluded = compile_search(self.exclude) if self.exclude else None
+
+        if included and excluded:
+            self.keep = lambda line: included(line) and not excluded(line)
+        elif excluded:
+            self.keep = lambda line: not excluded(line)
+        else:
+            self.keep = included
+
+    def __bool__(self):
+        return self.keep is not None
+
+    def __reduce__(self):
+        # The compiled functions cannot be pickled for the --jobs workers
+        return LineMatcher, (self.match, self.exclude)
+
+    def select(self, lines):
+        """Returns an iterator over the kept lines"""
+
+        if self.keep is None:
+            return iter(lines)
+
+        return filter(self.keep, lines)
+
+    def select_pairs(self, lines):
+        """Returns an iterator over the kept tuples whose last item is the
+        line, e.g. the (number, line) pairs of enumerate or the (number,
+        offset, line) tuples of a mapped file"""
+
+        if self.keep is None:
+            return iter(lines)
+
+        keep = self.keep
+        return (pair for pair in lines if keep(pair[-1]))
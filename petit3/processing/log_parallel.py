@@ -0,0 +1,130 @@
+"""Shards the hashing of log files over several processes. Each file is
+split into byte ranges aligned to line starts, each range is parsed and
+scrubbed by a worker into its own SuperHash and the partial hashes are
+merged in input order, which gives the same result as a serial run.
+
+"""
+
+import locale
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_offsets(path, jobs, span=None):
+    """Splits a file, or the (start, end) span of a file starting at the
+    beginning of a line, into at most jobs (start, end) byte ranges, every
+    range starting at the beginning of a line"""
+
+    start, end = span or (0, os.path.getsize(path))
+    offsets = [start]
+
+    with open(path, "rb") as f:
+        for i in range(1, jobs):
+            f.seek(max(start + (end - start) * i // jobs, offsets[-1]))
+
+            # Skip the rest of the line the rough offset landed in
+            if f.tell() > start:
+                f.readline()
+
+            if f.tell() < end and f.tell() > offsets[-1]:
+                offsets.append(f.tell())
+
+    offsets.append(end)
+
+    return list(zip(offsets[:-1], offsets[1:]))
+
+
+def read_chunk(path, start, end):
+    """Yields the decoded lines of a file between two byte offsets"""
+
+    encoding = locale.getpreferredencoding(False)
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+
+            position += len(line)
+            yield line.decode(encoding)
+
+
+def hash_chunk(task):
+    """Worker which builds a partial hash from one byte range of a file.
+    Returns the hash contents, the number of lines read before the end or
+    before a line that could not be parsed, and whether parsing stopped on
+    such a line"""
+
+    path, start, end, Entry, LogHash, filter_filename, time_range, matcher = task
+    state = {"lines": 0, "failed": False}
+
+    def lines():
+        # Lines are counted before they are selected, so that errors give
+        # the line of the file
+        for line in read_chunk(path, start, end):
+            state["lines"] += 1
+            yield line
+
+    def entries():
+        for line in matcher.select(lines()):
+            try:
+                entry = Entry(line)
+            except (ValueError, TypeError):
+                # Lines before the one which cannot be parsed
+                state["lines"] -= 1
+                state["failed"] = True
+                return
+
+            if entry in time_range:
+                yield entry
+
+    x = LogHash(None, filter_filename)
+    x.fill(entries())
+
+    return x.data, state["lines"], state["failed"]
+
+
+def parallel_fill(LogHash, log, filter_filename, jobs):
+    """Builds a LogHash from the files of a log with a pool of jobs
+    processes"""
+
+    tasks = [
+        (
+            path,
+            start,
+            end,
+            log.Entry,
+            LogHash,
+            filter_filename,
+            log.time_range,
+            log.matcher,
+        )
+        for path in log.file_names
+        for start, end in chunk_offsets(path, jobs, log.spans.get(path))
+    ]
+    logger.info(f"Hashing {len(tasks)} chunks with {jobs} jobs")
+
+    x = LogHash(None, filter_filename)
+    counter = 0
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Merge in input order so samples match the serial build
+        for data, lines, failed in executor.map(hash_chunk, tasks):
+            counter += lines
+
+            if failed:
+                print("Cannot parse values on line: " + str(counter))
+                sys.exit()
+
+            x.merge(data)
+
+    x.cleanup()
+
+    return x
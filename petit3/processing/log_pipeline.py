@@ -0,0 +1,223 @@
+"""Overlaps reading and parsing a log with aggregating its entries. A
+reader thread reads blocks of lines, a parser thread turns each block
+into a batch of entries and the caller, which feeds the hashes and
+graphs, takes the batches in order. The stages are connected by bounded
+queues, so a slow stage holds the others back instead of buffering the
+whole log.
+
+Threads share the GIL, so parsing does not run alongside aggregating, but
+waiting for standard input and for the decompression thread of a
+compressed log does. Each stage counts the items it handled, the time it
+spent on them and the time it waited for the others, which are logged at
+the end so that the slowest stage can be found.
+
+"""
+
+import logging
+import queue
+import threading
+import time
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+# Lines in a block and entries in a batch handed between the stages
+BATCH_SIZE = 1024
+
+# Blocks and batches waiting between two stages
+QUEUE_SIZE = 16
+
+# Seconds between checks whether the pipeline was stopped, while waiting
+POLL_INTERVAL = 0.1
+
+STAGES = ("read", "parse", "aggregate")
+
+
+class Stage:
+    """Counters of one stage, the items and batches it handled, and the
+    seconds it spent working and waiting for the other stages"""
+
+    __slots__ = ("name", "items", "batches", "busy", "waiting")
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+
+    def __str__(self):
+        rate = self.items / self.busy if self.busy else 0
+
+        return (
+            f"{self.name}: {self.items} items in {self.batches} batches, "
+            f"{self.busy:.2f}s busy ({rate:.0f}/s), {self.waiting:.2f}s waiting"
+        )
+
+
+class Pipeline:
+    """Iterates over the entries parse yields for lines, a generator
+    function, reading the lines in one thread and parsing them in another.
+    Errors and exits of a stage are raised again by the iteration"""
+
+    def __init__(self, lines, parse, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.stages = {name: Stage(name) for name in STAGES}
+        self.stopped = threading.Event()
+
+        self.blocks = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue(maxsize=queue_size)
+
+        self.threads = [
+            threading.Thread(
+                target=self.run, args=(self.read, lines, self.blocks), daemon=True
+            ),
+            threading.Thread(
+                target=self.run, args=(self.parse, parse, self.batches), daemon=True
+            ),
+        ]
+
+    def __iter__(self):
+        stage = self.stages["aggregate"]
+
+        for thread in self.threads:
+            thread.start()
+
+        try:
+            while True:
+                start = time.perf_counter()
+                batch = self.batches.get()
+                stage.waiting += time.perf_counter() - start
+
+                if isinstance(batch, BaseException):
+                    raise batch
+
+                if batch is None:
+                    return
+
+                start = time.perf_counter()
+                yield from batch
+                stage.busy += time.perf_counter() - start
+
+                stage.items += len(batch)
+                stage.batches += 1
+        finally:
+            self.stop()
+
+            for stage in self.stages.values():
+                logger.info(f"Pipeline {stage}")
+
+    def run(self, work, source, output):
+        """Runs a stage in its thread, the end of its output is marked by
+        None, or by the error which stopped it"""
+
+        try:
+            work(source)
+        except BaseException as e:
+            self.put(output, e)
+        else:
+            self.put(output, None)
+
+    def put(self, output, item):
+        """Puts an item on a queue unless the pipeline is stopped first.
+        Returns False if it was stopped"""
+
+        while not self.stopped.is_set():
+            try:
+                output.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def get(self, source):
+        """Gets an item from a queue, or None if the pipeline is stopped
+        first"""
+
+        while not self.stopped.is_set():
+            try:
+                return source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+        return None
+
+    def send(self, stage, output, batch, start):
+        """Counts a batch a stage worked on since start and puts it on its
+        output queue"""
+
+        now = time.perf_counter()
+        stage.busy += now - start
+        stage.items += len(batch)
+        stage.batches += 1
+
+        sent = self.put(output, batch)
+        stage.waiting += time.perf_counter() - now
+
+        return sent
+
+    def read(self, lines):
+        """Reader stage, puts blocks of lines on the blocks queue"""
+
+        stage = self.stages["read"]
+        lines = iter(lines)
+
+        while True:
+            start = time.perf_counter()
+            block = list(islice(lines, self.batch_size))
+            if not block:
+                return
+
+            if not self.send(stage, self.blocks, block, start):
+                return
+
+    def received_lines(self):
+        """Yields the lines of the blocks of the reader stage"""
+
+        stage = self.stages["parse"]
+
+        while True:
+            start = time.perf_counter()
+            block = self.get(self.blocks)
+            stage.waiting += time.perf_counter() - start
+
+            if isinstance(block, BaseException):
+                raise block
+
+            if block is None:
+                return
+
+            yield from block
+
+    def parse(self, parse):
+        """Parser stage, puts batches of entries on the batches queue"""
+
+        stage = self.stages["parse"]
+        entries = parse(self.received_lines())
+
+        while True:
+            start = time.perf_counter()
+            waited = stage.waiting
+
+            batch = list(islice(entries, self.batch_size))
+            if not batch:
+                return
+
+            # Time waiting for blocks is counted by received_lines
+            start += stage.waiting - waited
+
+            if not self.send(stage, self.batches, batch, start):
+                return
+
+    def stop(self):
+        """Stops the threads, which may wait for room on a full queue"""
+
+        self.stopped.set()
+
+        for output in (self.blocks, self.batches):
+            try:
+                while True:
+                    output.get_nowait()
+            except queue.Empty:
+                pass
@@ -0,0 +1,182 @@
+"""Finds the byte range of a log file which holds the entries of a time
+range, by binary search on byte offsets. Each probe skips to the start of
+the next line and parses the first line with a timestamp from there, so
+only a few lines are parsed per probe. Logs are expected to be roughly in
+timestamp order; the range is widened by a slack on both sides so that
+entries which are a little out of order are still found, and the entries
+outside of the time range are dropped after parsing.
+
+"""
+
+import datetime
+import locale
+import logging
+import os
+
+from .log_entries import ABNORMAL_STAMP
+
+logger = logging.getLogger(__name__)
+
+# Time range is widened by this much on both sides, for entries which are
+# logged out of order
+SLACK = datetime.timedelta(minutes=5)
+
+# Below this many bytes the search reads the lines one after the other
+LINEAR_SIZE = 2**16
+
+# Lines read after a probe offset to find a timestamp
+PROBE_LINES = 100
+
+
+def stamp(date):
+    """Returns the year, month, day, hour, minute and second of a date"""
+    return tuple(date.timetuple()[:6])
+
+
+class TimeRange:
+    """Entries between since and until, both datetimes which may be None"""
+
+    def __init__(self, since=None, until=None):
+        self.since = since
+        self.until = until
+
+    def __bool__(self):
+        return self.since is not None or self.until is not None
+
+    def __contains__(self, entry):
+        entry_stamp = entry.stamp
+
+        if self.since is not None and entry_stamp < stamp(self.since):
+            return False
+
+        if self.until is not None and entry_stamp > stamp(self.until):
+            return False
+
+        return True
+
+    def span(self, path, Entry, span=None):
+        """Returns the (start, end) byte offsets of the part of a plain file,
+        or of the given span of it, which holds the time range"""
+
+        start, end = span or (0, os.path.getsize(path))
+        probe = Probe(path, Entry)
+
+        try:
+            if self.since is not None:
+                start = probe.search(stamp(self.since - SLACK), start, end)
+
+            if self.until is not None:
+                end = probe.search(stamp(self.until + SLACK), start, end, after=True)
+        finally:
+            probe.close()
+
+        logger.info(f"Reading bytes {start} to {end} of {path}")
+
+        return start, max(start, end)
+
+
+class Probe:
+    """Reads the timestamps of the lines of a file at byte offsets"""
+
+    def __init__(self, path, Entry):
+        self.file = open(path, "rb")
+        self.Entry = Entry
+        self.encoding = locale.getpreferredencoding(False)
+
+    def close(self):
+        self.file.close()
+
+    def line_start(self, offset, low):
+        """Returns the start of the first line at or after offset, lines
+        start at low or after a newline"""
+
+        if offset <= low:
+            return low
+
+        self.file.seek(offset - 1)
+        self.file.readline()
+
+        return self.file.tell()
+
+    def line_stamp(self, line):
+        """Returns the timestamp of a line, or None if it has none"""
+
+        try:
+            entry_stamp = self.Entry(line.decode(self.encoding, "replace")).stamp
+        except (ValueError, TypeError):
+            return None
+
+        if entry_stamp == ABNORMAL_STAMP:
+            return None
+
+        return entry_stamp
+
+    def first_stamp(self, offset, end):
+        """Returns the offset and the timestamp of the first line with a
+        timestamp among a few lines from the line starting at offset. The
+        timestamp is None if there is none, the offset is then where the
+        lines read end"""
+
+        self.file.seek(offset)
+
+        for i in range(PROBE_LINES):
+            if offset >= end:
+                break
+
+            line = self.file.readline()
+            if not line:
+                break
+
+            entry_stamp = self.line_stamp(line)
+            if entry_stamp is not None:
+                return offset, entry_stamp
+
+            offset += len(line)
+
+        return min(offset, end), None
+
+    def search(self, target, low, high, after=False):
+        """Returns the start of the first line between the line starts low
+        and high whose timestamp is at or after target, or with after=True
+        after target. Lines without a timestamp are kept in the range"""
+
+        def before(entry_stamp):
+            if after:
+                return entry_stamp <= target
+            return entry_stamp < target
+
+        # Binary search down to a range which is read line by line
+        while high - low > LINEAR_SIZE:
+            middle = self.line_start((low + high) // 2, low)
+            if middle >= high:
+                break
+
+            offset, entry_stamp = self.first_stamp(middle, high)
+
+            if entry_stamp is None:
+                # Lines without timestamps, move the end of the range after
+                # them and its start before them
+                if after:
+                    low = offset
+                else:
+                    high = middle
+            elif before(entry_stamp):
+                self.file.seek(offset)
+                low = offset + len(self.file.readline())
+            else:
+                high = middle
+
+        self.file.seek(low)
+
+        while low < high:
+            line = self.file.readline()
+            if not line:
+                break
+
+            entry_stamp = self.line_stamp(line)
+            if entry_stamp is not None and not before(entry_stamp):
+                return low
+
+            low += len(line)
+
+        return high
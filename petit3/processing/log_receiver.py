@@ -0,0 +1,296 @@
+"""Receives syslog messages on UDP, TCP or Unix datagram sockets and feeds
+them to reports as they arrive, instead of writing them to a log file
+which is read again. Messages are RFC 3164 lines, which are turned into
+the lines syslog writes to a file and parsed as SyslogEntry, or as
+RSyslogEntry when they carry a high precision timestamp.
+
+Received messages wait in a bounded queue until they are parsed. TCP
+connections are not read while the queue is full, so senders are slowed
+down, while datagrams which do not fit are dropped and counted.
+
+"""
+
+import asyncio
+import logging
+import os
+import re
+import signal
+import socket
+import stat
+from collections import Counter
+from urllib.parse import urlsplit
+
+from .log_entries import RSyslogEntry, SyslogEntry
+
+logger = logging.getLogger(__name__)
+
+# Messages waiting to be parsed, and the longest message read from TCP
+QUEUE_SIZE = 10000
+MAX_MESSAGE = 2**16
+
+# Messages parsed before other tasks, e.g. receiving, get a turn
+BATCH_SIZE = 256
+
+# Priority at the start of a message, e.g. <13>
+PRIORITY_RE = re.compile(rb"<[0-9]{1,3}>")
+
+SCHEMES = ("udp", "tcp", "unix")
+
+
+def parse_address(string):
+    """Splits an address like udp://127.0.0.1:514, tcp://:5514 or
+    unix:///run/petit3.sock into its scheme and (host, port) or path"""
+
+    url = urlsplit(string)
+
+    if url.scheme not in SCHEMES:
+        raise ValueError(
+            f"unknown scheme in {string}, choose from {', '.join(SCHEMES)}"
+        )
+
+    if url.scheme == "unix":
+        if not url.path:
+            raise ValueError(f"no socket path in {string}")
+        return url.scheme, url.path
+
+    if url.port is None:
+        raise ValueError(f"no port in {string}")
+
+    return url.scheme, (url.hostname or "0.0.0.0", url.port)
+
+
+def message_line(data, host):
+    """Returns the line a syslog message is written to a log file as"""
+
+    priority = PRIORITY_RE.match(data)
+    if priority:
+        data = data[priority.end() :]
+
+    line = data.decode("utf-8", "replace").rstrip("\r\n\x00")
+
+    # Local messages have no host, e.g. "Feb 29 11:53:08 sshd[12]: ..."
+    words = line.split(None, 4)
+    if len(words) >= 4 and not line[:1].isdigit() and words[3].endswith(":"):
+        line = " ".join(words[:3] + [host] + words[3:])
+
+    return line
+
+
+class SyslogReceiver:
+    """Listens on syslog sockets and hands each parsed entry to consume.
+    The counters keep the number of messages received, dropped because
+    the queue was full, too long to be read and not parsable. Only the
+    messages kept by matcher, a LineMatcher, are parsed"""
+
+    def __init__(
+        self, consume, queue_size=QUEUE_SIZE, max_message=MAX_MESSAGE, matcher=None
+    ):
+        self.consume = consume
+        self.matcher = matcher
+        self.queue_size = queue_size
+        self.max_message = max_message
+        self.hostname = socket.gethostname()
+
+        self.counters = Counter(received=0, dropped=0, oversized=0, malformed=0)
+        self.queue = None
+
+        # Paths of the Unix sockets bound, which are removed at the end
+        self.sockets = []
+
+    def display(self):
+        """Displays the counters like a hash"""
+
+        for name, count in self.counters.items():
+            cnt = str(count) + ":"
+            print(f"{cnt:<8}{name}")
+
+    def run(self, addresses, interval, dump):
+        """Receives until SIGINT or SIGTERM, calling dump every interval
+        seconds, on SIGUSR1 and once more at the end"""
+        asyncio.run(self.serve(addresses, interval, dump))
+
+    async def serve(self, addresses, interval, dump):
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+
+        servers = []
+        parser = None
+
+        try:
+            for scheme, address in addresses:
+                servers.append(await self.listen(scheme, address))
+
+            parser = asyncio.ensure_future(self.parse())
+
+            stopped = asyncio.Event()
+            loop.add_signal_handler(signal.SIGINT, stopped.set)
+            loop.add_signal_handler(signal.SIGTERM, stopped.set)
+            loop.add_signal_handler(signal.SIGUSR1, dump)
+
+            while not stopped.is_set():
+                try:
+                    await asyncio.wait_for(stopped.wait(), interval)
+                except asyncio.TimeoutError:
+                    dump()
+        finally:
+            for server in servers:
+                server.close()
+            if parser is not None:
+                parser.cancel()
+            self.remove_sockets()
+
+        # Parse what was received before stopping
+        while not self.queue.empty():
+            self.parse_message(*self.queue.get_nowait())
+
+        dump()
+
+    async def listen(self, scheme, address):
+        """Starts a server, which is returned to be closed"""
+
+        loop = asyncio.get_running_loop()
+
+        if scheme == "tcp":
+            return await asyncio.start_server(
+                self.receive_stream, *address, limit=self.max_message
+            )
+
+        if scheme == "unix":
+            # A socket left behind is replaced, any other file is kept
+            if self.is_socket(address):
+                os.unlink(address)
+            elif os.path.lexists(address):
+                raise FileExistsError(f"{address} exists and is not a socket")
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.bind(address)
+            except OSError:
+                sock.close()
+                raise
+            self.sockets.append(address)
+
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: DatagramReceiver(self), sock=sock
+            )
+        else:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: DatagramReceiver(self), local_addr=address
+            )
+
+        logger.info(f"Listening on {scheme} {address}")
+
+        return transport
+
+    @staticmethod
+    def is_socket(path):
+        """Whether path is a socket, and not a link to one"""
+
+        try:
+            return stat.S_ISSOCK(os.lstat(path).st_mode)
+        except FileNotFoundError:
+            return False
+
+    def remove_sockets(self):
+        """Removes the Unix sockets which were bound"""
+
+        for path in self.sockets:
+            if self.is_socket(path):
+                os.unlink(path)
+
+        self.sockets = []
+
+    def offer(self, data, host):
+        """Queues a datagram, or drops it when the queue is full"""
+
+        self.counters["received"] += 1
+
+        try:
+            self.queue.put_nowait((data, host))
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+
+    async def receive_stream(self, reader, writer):
+        """Queues the newline separated messages of a TCP connection, the
+        connection is not read while the queue is full"""
+
+        host = writer.get_extra_info("peername")[0]
+
+        try:
+            while True:
+                try:
+                    data = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    # The last message may not end with a newline
+                    data = e.partial
+                    if not data:
+                        break
+                except asyncio.LimitOverrunError as e:
+                    self.counters["oversized"] += 1
+                    await reader.readexactly(e.consumed)
+                    await self.skip_message(reader)
+                    continue
+
+                self.counters["received"] += 1
+                await self.queue.put((data, host))
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.info(f"Connection from {host} lost: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def skip_message(reader):
+        """Skips the rest of a message which is too long"""
+
+        while True:
+            try:
+                await reader.readuntil(b"\n")
+                return
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+
+    async def parse(self):
+        """Parses queued messages as they arrive"""
+
+        parsed = 0
+
+        while True:
+            self.parse_message(*await self.queue.get())
+
+            # Getting from a queue which is not empty never waits
+            parsed += 1
+            if parsed % BATCH_SIZE == 0:
+                await asyncio.sleep(0)
+
+    def parse_message(self, data, host):
+        """Hands the entry of a message to consume"""
+
+        line = message_line(data, host)
+
+        if self.matcher and not self.matcher.keep(line):
+            return
+
+        # High precision timestamps start with the year
+        Entry = RSyslogEntry if line[:1].isdigit() else SyslogEntry
+
+        try:
+            self.consume(Entry(line))
+        except (ValueError, TypeError):
+            self.counters["malformed"] += 1
+            logger.debug(f"Cannot parse values on message: {line}")
+
+
+class DatagramReceiver(asyncio.DatagramProtocol):
+    """Queues the messages received on a UDP or Unix datagram socket"""
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+
+    def datagram_received(self, data, addr):
+        # Unix datagrams come from the local host
+        if isinstance(addr, tuple):
+            host = addr[0]
+        else:
+            host = self.receiver.hostname
+
+        self.receiver.offer(data, host)
@@ -0,0 +1,167 @@
+"""Checkpoints of a hash over a growing log file, for runs from cron.
+The state file keeps the device, inode and byte offset up to which the
+log was read, along with the counts and samples of the hash. The next
+run only parses the lines appended after the offset and adds them to the
+saved hash. A log which was rotated, truncated or rewritten since is read
+again from the start.
+
+The state is saved as JSON, the entry type and the hash type by name and
+the samples as their lines, so that loading a state file cannot run code.
+
+"""
+
+import json
+import logging
+import os
+
+from . import log_hash
+from .log_cache import check_bytes, dump
+from .log_crunch import CrunchLog
+from .log_input import compression, line_end
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the layout of the state file changes
+VERSION = 3
+
+
+class LogState:
+    """Saved hash of a log file and the offset up to which it was read.
+    patterns are the --match and --exclude patterns the lines were
+    selected with"""
+
+    def __init__(
+        self, path, log_path, filter_filename=None, log_format=None, patterns=None
+    ):
+        if log_path == "<stdin>" or compression(log_path) is not None:
+            raise ValueError(f"Cannot keep the state of {log_path}, not a plain file")
+
+        status = os.stat(log_path)
+
+        self.path = path
+        self.log_path = log_path
+        self.filter_filename = filter_filename
+        self.log_format = log_format
+        self.patterns = list(patterns) if patterns is not None else None
+        self.device = status.st_dev
+        self.inode = status.st_ino
+        self.end = line_end(log_path, status.st_size)
+
+        self.state = self.load()
+
+        if self.state and not self.current:
+            logger.info(f"{log_path} changed since {path}, reading it from the start")
+            self.state = None
+
+    @property
+    def current(self):
+        """Whether the saved state is of the log file as it is now, which
+        may only have been appended to"""
+
+        state = self.state
+
+        return (
+            state["device"] == self.device
+            and state["inode"] == self.inode
+            and state["filter"] == self.filter_filename
+            and state["patterns"] == self.patterns
+            and self.log_format in (None, state["Entry"].format)
+            and state["offset"] <= self.end
+            and state["check"] == check_bytes(self.log_path, state["offset"])
+        )
+
+    @property
+    def start(self):
+        return self.state["offset"] if self.state else 0
+
+    @property
+    def span(self):
+        """Byte range of the log which has not been read yet"""
+        return (self.start, self.end)
+
+    @property
+    def Entry(self):
+        return self.state["Entry"] if self.state else None
+
+    def load(self):
+        """Returns the saved state, or None"""
+
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring state {self.path}: {e}")
+            return None
+
+        if not isinstance(state, dict) or state.get("version") != VERSION:
+            return None
+
+        # Types are saved by name
+        LogHash = getattr(log_hash, str(state.get("hash")), None)
+        if not (isinstance(LogHash, type) and issubclass(LogHash, log_hash.SuperHash)):
+            logger.warning(f"Ignoring state {self.path}: unknown hash type")
+            return None
+
+        try:
+            Entry = CrunchLog.formats()[state["format"]]
+            state["check"] = bytes.fromhex(state["check"])
+            state["data"] = {
+                key: [count, log_hash.Samples.load(samples, Entry)]
+                for key, count, samples in state["data"]
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Ignoring state {self.path}: {e}")
+            return None
+
+        state["Entry"] = Entry
+        state["LogHash"] = LogHash
+
+        return state
+
+    def restore(self):
+        """Returns the saved hash, or None"""
+
+        if not self.state:
+            return None
+
+        x = self.state["LogHash"](None, self.filter_filename)
+        x.data = self.state["data"]
+
+        return x
+
+    def update(self, x):
+        """Adds the hash of the unread lines to the saved hash and returns
+        the combined hash"""
+
+        saved = self.restore()
+        if saved is None:
+            return x
+
+        saved.merge(x)
+
+        return saved
+
+    def save(self, x, Entry):
+        """Saves a hash of the log up to the end of its last complete line"""
+
+        state = {
+            "version": VERSION,
+            "device": self.device,
+            "inode": self.inode,
+            "offset": self.end,
+            "check": check_bytes(self.log_path, self.end).hex(),
+            "filter": self.filter_filename,
+            "patterns": self.patterns,
+            "format": Entry.format,
+            "hash": type(x).__name__,
+            "data": [
+                [key, count, samples.dump()] for key, (count, samples) in x.items()
+            ],
+        }
+
+        try:
+            dump(state, self.path, text=True)
+        except OSError as e:
+            logger.warning(f"Cannot write state {self.path}: {e}")
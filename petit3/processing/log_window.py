@@ -0,0 +1,105 @@
+"""Sliding time window for the counts of a SuperHash. The window is split
+into a ring of buckets, each of which counts and samples the keys of the
+entries of its time slot. When newer entries move the window on, the
+buckets which fall out of it are subtracted from the hash and reused, so
+old entries expire without going over the entries again. The samples of
+the keys they held are rebuilt from the buckets left in the window.
+
+"""
+
+from .log_hash import Samples
+
+# Number of buckets the window is split into
+SLOTS = 60
+
+
+class TimeWindow:
+    """Ring of the key counts and samples of the last span seconds, in
+    SLOTS buckets.
+    The window ends at the newest timestamp seen, or at the time it was
+    slid to, and entries from before the window are not counted"""
+
+    def __init__(self, span, slots=SLOTS):
+        self.width = max(1, span // slots)
+        self.slots = [{} for i in range(slots)]
+
+        # Newest bucket of the window
+        self.head = None
+
+    def admit(self, x, key, epoch, entry, count=1):
+        """Counts and samples an entry of a hash in its bucket. Returns
+        False if the entry is too old to be in the window"""
+
+        bucket = epoch // self.width
+
+        if self.head is None or bucket > self.head:
+            self.advance(x, bucket)
+        elif bucket <= self.head - len(self.slots):
+            return False
+
+        slot = self.slots[bucket % len(self.slots)]
+        if key not in slot:
+            slot[key] = [0, Samples()]
+
+        slot[key][0] += count
+        slot[key][1].append(entry, count)
+
+        return True
+
+    def slide(self, x, epoch):
+        """Moves the window on to end at epoch seconds, e.g. now"""
+
+        bucket = epoch // self.width
+
+        if self.head is not None and bucket > self.head:
+            self.advance(x, bucket)
+
+    def advance(self, x, bucket):
+        """Makes bucket the newest bucket, expiring the buckets which are
+        no longer in the window"""
+
+        expired_keys = set()
+
+        if self.head is not None:
+            # A jump of more than the window expires every bucket once
+            start = max(self.head + 1, bucket - len(self.slots) + 1)
+
+            for expired in range(start, bucket + 1):
+                slot = self.slots[expired % len(self.slots)]
+                expired_keys.update(self.expire(x, slot))
+
+        self.head = bucket
+
+        for key in expired_keys:
+            if key in x:
+                x[key][1] = self.samples(key)
+
+    @staticmethod
+    def expire(x, slot):
+        """Subtracts the counts of a bucket from a hash and empties it.
+        Returns the keys the bucket held"""
+
+        for key, (count, samples) in slot.items():
+            # Keys can be removed by cleanup in the meantime
+            if key in x:
+                x[key][0] -= count
+                if x[key][0] <= 0:
+                    del x[key]
+
+        keys = list(slot)
+        slot.clear()
+
+        return keys
+
+    def samples(self, key):
+        """Returns the samples of a key merged from the buckets of the
+        window, oldest first"""
+
+        samples = Samples()
+
+        for bucket in range(self.head - len(self.slots) + 1, self.head + 1):
+            slot = self.slots[bucket % len(self.slots)]
+            if key in slot:
+                samples.merge(slot[key][1])
+
+        return samples
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+"""Memory benchmark for parsed log entries
+
+Scales data/test08.log up to the given number of lines, 10 million by
+default, and reports how much memory the parsed entries need when they
+are held in a list, before and after their fields are used, as well as
+the peak memory of hashing the scaled log as a stream.
+
+    python3 bench_memory.py [lines]
+"""
+
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from itertools import cycle, islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from petit3.processing.log_entries import SecureLogEntry  # noqa: E402
+from petit3.processing.log_hash import STOPWORDS_HASH, SecureLogHash  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "test08.log")
+MEASURED_LINES = 100000
+
+
+def scaled_lines(lines):
+    """Yields the lines of test08.log over and over, each line is a new
+    string as if it had been read from a file"""
+    with open(DATA, "rb") as f:
+        buf = f.readlines()
+
+    return (line.decode() for line in islice(cycle(buf), lines))
+
+
+def entry_footprint(lines):
+    """Returns bytes per entry for fresh entries and for used entries"""
+
+    tracemalloc.start()
+    entries = [SecureLogEntry(line) for line in scaled_lines(lines)]
+    fresh = tracemalloc.get_traced_memory()[0]
+
+    for entry in entries:
+        entry.daemon, entry.log_entry
+
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return fresh / len(entries), used / len(entries)
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    measured = min(lines, MEASURED_LINES)
+
+    # Stream first, the peak resident set size never goes down again
+    start = time.time()
+    x = SecureLogHash(None, STOPWORDS_HASH)
+    x.fill(SecureLogEntry(line) for line in scaled_lines(lines))
+    elapsed = time.time() - start
+
+    # Linux reports the peak resident set size in KiB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    fresh, used = entry_footprint(measured)
+
+    print(f"Lines:\t\t\t{lines}")
+    print(f"Entry bytes:\t\t{fresh:.0f} (after use: {used:.0f})")
+    print(
+        f"Held in a list:\t\t{fresh * lines / 2 ** 20:.0f} MiB "
+        f"(after use: {used * lines / 2 ** 20:.0f} MiB)"
+    )
+    print(f"Streaming hash peak:\t{peak:.0f} MiB for {len(x)} keys")
+    print(f"Streaming hash time:\t{elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
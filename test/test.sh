@@ -16,6 +16,20 @@ else
 	echo " Passed: Petit $VERSION with no input"
 fi
 
+# Lint test, the sources must pass black like the CI, so that every commit
+# of a series is checked when the tests are run
+if command -v black > /dev/null
+then
+	echo -n -e "Testing: black --check petit3: \n"
+
+	if ! black --check --quiet ../petit3
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+fi
+
 
 
 # Routine Tests
@@ -65,6 +79,529 @@ do
 
 	done
 done
+
+# Parallel tests, sharded hashing must match the serial output
+for function in $functions
+do
+	for test in `ls data/*.log`
+	do
+		# Get the right name for the test
+		test=`basename $test | cut -f1 -d"."`
+
+		echo -n -e "Testing: petit --$function --jobs 4 $test.log: \n"
+
+                ACTUAL=$TMP/${test}-${function}-jobs.actual.tmp
+                TARGET=$TMP/${test}-${function}-jobs.target.tmp
+
+                cat output/${test}-${function}.output \
+                  | sed 's/\:\s*/,/' > $TARGET
+
+		$PETIT --${function} --jobs 4 data/${test}.log \
+                  | sed 's/\:\s*/,/' > $ACTUAL
+
+		if ! diff $TARGET $ACTUAL
+		then
+			echo " Failed"
+		else
+			rm $ACTUAL $TARGET
+			echo " Passed"
+		fi
+	done
+done
+
+# Report tests, one pass must match the separate reports
+reports="hash,host,daemon"
+
+for test in `ls data/*.log`
+do
+	# Get the right name for the test
+	test=`basename $test | cut -f1 -d"."`
+
+	# Logs which stop with an error only report the first one
+	if grep -q -e "^Cannot parse" -e "^No data" output/${test}-hash.output
+	then
+		continue
+	fi
+
+	echo -n -e "Testing: petit --report $reports $test.log: \n"
+
+        ACTUAL=$TMP/${test}-report.actual.tmp
+        TARGET=$TMP/${test}-report.target.tmp
+
+        for function in ${reports//,/ }
+        do
+                [ "$function" != "hash" ] && echo
+                echo "== $function =="
+                cat output/${test}-${function}.output
+        done | sed 's/\:\s*/,/' > $TARGET
+
+	$PETIT --report $reports data/${test}.log \
+          | sed 's/\:\s*/,/' > $ACTUAL
+
+	if ! diff $TARGET $ACTUAL
+	then
+		echo " Failed"
+	else
+		rm $ACTUAL $TARGET
+		echo " Passed"
+	fi
+done
+
+# A graph without entries must not stop the other reports
+echo -n -e "Testing: petit --report hash,hgraph without entries: \n"
+
+if ! diff <(echo -e "== hash ==\n\n== hgraph ==\nNo entries") \
+          <($PETIT --report hash,hgraph --match "no such line" data/test01.log)
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+
+# Compressed tests, compressed logs must give the same hashes
+for compress in gzip bzip2 xz
+do
+	for test in `ls data/*.log`
+	do
+		# Get the right name for the test
+		test=`basename $test | cut -f1 -d"."`
+
+		echo -n -e "Testing: petit --hash $test.log ($compress): \n"
+
+                ACTUAL=$TMP/${test}-${compress}.actual.tmp
+                TARGET=$TMP/${test}-${compress}.target.tmp
+
+                cat output/${test}-hash.output | sed 's/\:\s*/,/' > $TARGET
+
+                $compress -c data/${test}.log > $TMP/${test}.log.compressed
+		$PETIT --hash $TMP/${test}.log.compressed \
+                  | sed 's/\:\s*/,/' > $ACTUAL
+                rm $TMP/${test}.log.compressed
+
+		if ! diff $TARGET $ACTUAL
+		then
+			echo " Failed"
+		else
+			rm $ACTUAL $TARGET
+			echo " Passed"
+		fi
+	done
+done
+
+# Rotation tests, a log split into several files must give the same
+# hashes, and the same graphs when the files are given out of order
+test="test08"
+split -d -l 500 data/${test}.log $TMP/${test}.log.
+gzip $TMP/${test}.log.00
+
+echo -n -e "Testing: petit --hash $test.log.*: \n"
+if ! diff <(sed 's/\:\s*/,/' output/${test}-hash.output) \
+          <($PETIT --hash "$TMP/${test}.log.*" | sed 's/\:\s*/,/')
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+
+echo -n -e "Testing: petit --dgraph --end last $test.log.*: \n"
+if ! diff <($PETIT --dgraph --end last data/${test}.log) \
+          <($PETIT --dgraph --end last $(ls -r $TMP/${test}.log.*))
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+rm $TMP/${test}.log.*
+
+# A file whose name holds glob characters is read as it is named
+test="test01"
+cp data/${test}.log "$TMP/${test}[1].log"
+
+echo -n -e "Testing: petit --hash $test[1].log: \n"
+if ! diff <(sed 's/\:\s*/,/' output/${test}-hash.output) \
+          <($PETIT --hash "$TMP/${test}[1].log" | sed 's/\:\s*/,/')
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+rm "$TMP/${test}[1].log"
+
+# Format tests, giving the format must match detecting it
+for test_format in test01:syslog test03:apache-access test07:snort test08:secure \
+	test09:apache-error test10:rsyslog test02:raw
+do
+	test=${test_format%%:*}
+	format=${test_format#*:}
+
+	echo -n -e "Testing: petit --hash --format $format $test.log: \n"
+
+	if ! diff <(sed 's/\:\s*/,/' output/${test}-hash.output) \
+	          <($PETIT --hash --format $format data/${test}.log | sed 's/\:\s*/,/')
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+done
+
+# Mapped tests, memory mapped logs must give the same hashes
+for test in `ls data/*.log`
+do
+	# Get the right name for the test
+	test=`basename $test | cut -f1 -d"."`
+
+	echo -n -e "Testing: petit --hash --mmap $test.log: \n"
+
+	if ! diff <(sed 's/\:\s*/,/' output/${test}-hash.output) \
+	          <($PETIT --hash --mmap data/${test}.log | sed 's/\:\s*/,/')
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+done
+
+# Cache tests, a cached log must give the same reports when the cache is
+# written, when it is read and when the log has grown since
+CACHE=$TMP/cache
+test="test08"
+head -n 1000 data/${test}.log > $TMP/${test}.log
+
+for run in write read grown
+do
+	if [ "$run" == "grown" ]
+	then
+		tail -n +1001 data/${test}.log >> $TMP/${test}.log
+	fi
+
+	for function in host daemon
+	do
+		echo -n -e "Testing: petit --$function --cache $test.log ($run): \n"
+
+		if ! diff <($PETIT --$function $TMP/${test}.log | sed 's/\:\s*/,/') \
+		          <(XDG_CACHE_HOME=$CACHE $PETIT --$function --cache $TMP/${test}.log | sed 's/\:\s*/,/')
+		then
+			echo " Failed"
+		else
+			echo " Passed"
+		fi
+	done
+done
+rm -r $TMP/${test}.log $CACHE
+
+# State tests, hashing a log as it grows must match hashing it once, and
+# a rotated log must be hashed from the start
+STATE=$TMP/state
+for test in test01 test08 test10
+do
+	echo -n -e "Testing: petit --hash --state $test.log: \n"
+
+	: > $TMP/${test}.log
+	for lines in 1 500 1000 100000
+	do
+		head -n $lines data/${test}.log | tail -n +$(( $(wc -l < $TMP/${test}.log) + 1 )) \
+		  >> $TMP/${test}.log
+		$PETIT --hash --state $STATE $TMP/${test}.log > $TMP/${test}-state.actual.tmp
+	done
+
+	if ! diff <(sed 's/\:\s*/,/' output/${test}-hash.output) \
+	          <(sed 's/\:\s*/,/' $TMP/${test}-state.actual.tmp)
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+	rm $TMP/${test}.log $TMP/${test}-state.actual.tmp
+done
+
+echo -n -e "Testing: petit --hash --state test02.log (rotated): \n"
+cp data/test02.log $TMP/test02.log
+if ! diff <(sed 's/\:\s*/,/' output/test02-hash.output) \
+          <($PETIT --hash --state $STATE $TMP/test02.log | sed 's/\:\s*/,/')
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+rm $TMP/test02.log $STATE
+
+# Follow tests, the last report of a followed log must match the report
+# of the whole log, also when the log is rotated while it is followed
+test="test10"
+head -n 100 data/${test}.log > $TMP/${test}.log
+
+echo -n -e "Testing: petit --hash --follow $test.log: \n"
+timeout 6 $PETIT --hash --follow --interval 1 $TMP/${test}.log > $TMP/${test}-follow.tmp &
+sleep 2
+sed -n 101,300p data/${test}.log >> $TMP/${test}.log
+sleep 1.5
+mv $TMP/${test}.log $TMP/${test}.log.1
+sed -n 301,1000p data/${test}.log > $TMP/${test}.log
+wait
+
+head -n 1000 data/${test}.log > $TMP/${test}-all.log
+$PETIT --hash $TMP/${test}-all.log > $TMP/${test}-all.tmp
+
+if ! diff <(tail -n $(wc -l < $TMP/${test}-all.tmp) $TMP/${test}-follow.tmp) $TMP/${test}-all.tmp
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+rm $TMP/${test}.log $TMP/${test}.log.1 $TMP/${test}-*
+
+# Listen tests, the hash of syslog messages sent over TCP must match the
+# hash of the log they were sent from
+for test in test01 test10
+do
+	echo -n -e "Testing: petit --hash --listen tcp $test.log: \n"
+
+	$PETIT --hash --listen tcp://127.0.0.1:5514 --interval 3600 > $TMP/${test}-listen.tmp &
+	sleep 1
+	python3 -c "
+import socket, sys
+with socket.create_connection(('127.0.0.1', 5514)) as s:
+    s.sendall(b''.join(b'<13>' + line for line in open(sys.argv[1], 'rb')))
+" data/${test}.log
+	sleep 1
+	kill -TERM $!
+	wait
+
+	if ! diff <(sed 's/\:\s*/,/' output/${test}-hash.output) \
+	          <(sed -e '1d' -e '/^$/,$d' $TMP/${test}-listen.tmp | sed 's/\:\s*/,/')
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+	rm $TMP/${test}-listen.tmp
+done
+
+# A file which is not a socket must not be replaced by a Unix socket
+echo -n -e "Testing: petit --hash --listen unix file: \n"
+
+echo "not a socket" > $TMP/listen.txt
+
+if $PETIT --hash --listen unix://$TMP/listen.txt > /dev/null \
+   || [ "$(cat $TMP/listen.txt)" != "not a socket" ]
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+rm $TMP/listen.txt
+
+# Window tests, a window of the last 15 minutes must match the reports of
+# the lines of the last 60 buckets of 15 seconds
+test="test08"
+python3 -c "
+import calendar, sys, time
+lines = open(sys.argv[1]).readlines()
+epoch = lambda line: calendar.timegm(time.strptime('2000 ' + line[:15], '%Y %b %d %H:%M:%S'))
+head = epoch(lines[-1]) // 15
+sys.stdout.writelines(line for line in lines if epoch(line) // 15 > head - 60)
+" data/${test}.log > $TMP/${test}-window.log
+
+for function in hash host daemon
+do
+	echo -n -e "Testing: petit --$function --window 15 $test.log: \n"
+
+	if ! diff <($PETIT --$function $TMP/${test}-window.log) \
+	          <($PETIT --$function --window 15 --end last data/${test}.log)
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+done
+rm $TMP/${test}-window.log
+
+# The samples of a window must only come from the lines in the window, the
+# first line has the same key but a different text
+printf '%s\n' \
+	"Oct 17 10:40:00 host1 app[1]: foo 1111" \
+	"Oct 17 10:50:00 host1 app[1]: foo 2222" \
+	"Oct 17 10:58:00 host1 app[1]: foo 3333" \
+	"Oct 17 11:00:01 host1 app[1]: bar 4444" > $TMP/window.log
+tail -n +2 $TMP/window.log > $TMP/window-last.log
+
+echo -n -e "Testing: petit --hash --window 15 samples: \n"
+if ! diff <($PETIT --hash $TMP/window-last.log) \
+          <($PETIT --hash --window 15 --end last $TMP/window.log)
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+
+echo -n -e "Testing: petit --hash --allsample --window 15 samples: \n"
+if for run in 1 2 3 4 5 6 7 8
+do
+	$PETIT --hash --allsample --window 15 --end last $TMP/window.log
+done | grep "foo 1111"
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+rm $TMP/window.log $TMP/window-last.log
+
+# Range tests, the reports of the entries from --since to --until must
+# match the reports of the lines of that time range
+test="test08"
+awk '$3 >= "14:20:00" && $3 <= "14:50:30"' data/${test}.log > $TMP/${test}-range.log
+
+for function in hash host daemon
+do
+	echo -n -e "Testing: petit --$function --since --until $test.log: \n"
+
+	if ! diff <($PETIT --$function $TMP/${test}-range.log) \
+	          <($PETIT --$function --since "Jan 15 14:20" --until "Jan 15 14:50:30" data/${test}.log)
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+done
+rm $TMP/${test}-range.log
+
+# Match tests, the reports of the lines selected with --match and
+# --exclude must match the reports of the lines selected with grep
+test="test08"
+for function in hash host daemon
+do
+	echo -n -e "Testing: petit --$function --match --exclude $test.log: \n"
+
+	if ! diff <(grep -E 'sshd\[|Failed' data/${test}.log | grep -v maddock | $PETIT --$function) \
+	          <($PETIT --$function --match 'sshd\[' --match Failed --exclude maddock data/${test}.log)
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+done
+
+# A pattern starting with global flags only applies them to itself
+echo -n -e "Testing: petit --hash --match '(?i)...' $test.log: \n"
+
+if ! diff <(awk '/sshd\[/ || tolower($0) ~ /fail/' data/${test}.log | $PETIT --hash) \
+          <($PETIT --hash --match 'sshd\[' --match '(?i)fail(ed)?' data/${test}.log)
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+
+# Pipeline tests, parsing in threads must give the same reports, from a
+# compressed log and from standard input
+for test in test01 test08 test10
+do
+	for function in hash daemon wordcount
+	do
+		echo -n -e "Testing: petit --$function --pipeline $test.log: \n"
+
+		gzip -c data/${test}.log > $TMP/${test}.log.gz
+
+		if ! diff <($PETIT --$function data/${test}.log) \
+		          <($PETIT --$function --pipeline $TMP/${test}.log.gz) \
+		   || ! diff <($PETIT --$function data/${test}.log) \
+		             <($PETIT --$function --pipeline - < data/${test}.log)
+		then
+			echo " Failed"
+		else
+			echo " Passed"
+		fi
+
+		rm $TMP/${test}.log.gz
+	done
+done
+
+# Token scrubbing tests, scrubbing the words one by one with a cache must
+# give the same reports
+for test in test01 test08 test10
+do
+	for function in hash daemon host wordcount
+	do
+		echo -n -e "Testing: petit --$function --scrub-tokens $test.log: \n"
+
+		if ! diff <($PETIT --$function data/${test}.log) \
+		          <($PETIT --$function --scrub-tokens data/${test}.log)
+		then
+			echo " Failed"
+		else
+			echo " Passed"
+		fi
+	done
+done
+
+# Fingerprint tests, the reboots in a log must be found when the index of
+# the fingerprints is compiled and when it is read
+CACHE=$TMP/cache
+cat ../petit3/fingerprints/rhel5-reboot.fp ../petit3/fingerprints/fedora11-reboot.fp \
+    data/test01.log > $TMP/reboots.log
+
+for run in compile read
+do
+	echo -n -e "Testing: petit --hash --fingerprint reboots.log ($run): \n"
+
+	if ! diff <(echo -e "fedora11-reboot.fp\nrhel5-reboot.fp") \
+	          <(XDG_CACHE_HOME=$CACHE $PETIT --hash --fingerprint $TMP/reboots.log \
+	            | grep -o "[^ ]*\.fp$" | sort)
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+done
+rm -r $TMP/reboots.log
+
+# A reboot whose messages drifted is only found by similarity
+sed 's/main process/process/; s/kernel: /kernel: [boot] /' \
+    ../petit3/fingerprints/fedora11-reboot.fp > $TMP/drifted.log
+
+echo -n -e "Testing: petit --hash --fingerprint --similarity 0.6 drifted.log: \n"
+
+if XDG_CACHE_HOME=$CACHE $PETIT --hash --fingerprint $TMP/drifted.log | grep -q "fedora11" \
+   || ! XDG_CACHE_HOME=$CACHE $PETIT --hash --fingerprint --similarity 0.6 $TMP/drifted.log \
+        | grep -q "fedora11-reboot.fp$"
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+rm -r $TMP/drifted.log $CACHE
+
+# Learn tests, a fingerprint learned from a reboot and a capture missing
+# some of its lines must hold the keys of the smaller capture
+capture=../petit3/fingerprints/rhel5-reboot.fp
+awk 'NR % 5 != 0' $capture > $TMP/capture.log
+
+echo -n -e "Testing: petit --learn rhel5-reboot.fp capture.log: \n"
+
+$PETIT --learn $TMP/reboot $capture $TMP/capture.log > /dev/null
+
+if ! diff <(tail -n +6 $TMP/reboot.fpl | sort) \
+          <($PETIT --hash --nosample $TMP/capture.log | sed 's/^[0-9]*:\s*//' | sort)
+then
+	echo " Failed"
+else
+	echo " Passed"
+fi
+rm $TMP/capture.log $TMP/reboot.fpl
+
+# Scrub tests, the compiled scrub engine must match the sequential one
+for test in `ls data/*.log`
+do
+	echo -n "Testing: petit --scrubcheck $test: "
+
+	if ! $PETIT --scrubcheck $test > /dev/null
+	then
+		echo " Failed"
+	else
+		echo " Passed"
+	fi
+done
 exit 0
 # Special hashing tests
 